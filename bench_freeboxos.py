@@ -0,0 +1,145 @@
+"""
+End-to-end benchmark of the recording flow against fake_freebox.py.
+
+It programs N recordings on a local fake Freebox with the chosen backend
+and reports the total time and the time per recording:
+
+    python3 bench_freeboxos.py --backend api -n 100
+    python3 bench_freeboxos.py --backend selenium -n 20 --latency 0.05
+    python3 bench_freeboxos.py --backend selenium -n 20 --workers 3
+
+The Selenium backend needs Firefox and geckodriver, as for a real run.
+With --max-per-recording the exit status is 1 when the mean time per
+recording is above the given number of seconds, so a regression can be
+caught by a script.
+"""
+import argparse
+import logging
+import statistics
+import sys
+import tempfile
+import time
+
+from datetime import datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import channel_index
+import freeboxos
+
+from channel_index import COLLIDING_NAMES
+from channels_free import CHANNELS_FREE
+from config_freeboxos import Settings
+from fake_freebox import start_fake_freebox
+from programme import Programme
+
+ADMIN_PASSWORD = "bench-password"
+APP_TOKEN = "bench-token"
+
+
+def make_programmes(count):
+    """
+    `count` programmes of one hour from tomorrow 20:00, spread over several
+    channels and days so that every date picker entry type is used. The
+    channels sharing a number in channels_free.py are left out: the Freebox
+    only names one of them, the others are not programmed.
+    """
+    channels = [
+        name for name, number in CHANNELS_FREE.items() if number not in COLLIDING_NAMES
+    ]
+    first_day = datetime.now(ZoneInfo("Europe/Paris")).replace(
+        hour=20, minute=0, second=0, microsecond=0
+    ) + timedelta(days=1)
+    programmes = []
+    for index in range(count):
+        start = first_day + timedelta(days=index % 6, minutes=5 * (index // 6))
+        programmes.append(Programme({
+            "channel": channels[index % len(channels)],
+            "title": f"Programme {index}",
+            "start": start.strftime("%Y%m%d%H%M"),
+            "duration": 3600,
+        }))
+    return programmes
+
+
+def run_benchmark(backend, count, latency, workers=1):
+    """Program `count` recordings. Return (programmed, total, per_recording)."""
+    server = start_fake_freebox(
+        app_token=APP_TOKEN, admin_password=ADMIN_PASSWORD, latency=latency
+    )
+    host, port = server.server_address
+    settings = Settings(
+        admin_password=ADMIN_PASSWORD,
+        freebox_server_ip=f"{host}:{port}",
+        media_select_titles=True,
+        max_sim_recordings=count,
+        https=False,
+        sentry_monitoring_sdk=False,
+        security_strict_mode=False,
+        recording_backend=backend,
+        freebox_app_token=APP_TOKEN,
+        browser_workers=workers,
+    )
+    programmes = make_programmes(count)
+    # Leave the channel cache of the real Freebox alone.
+    cache_dir = tempfile.TemporaryDirectory()
+    channel_index.CHANNEL_CACHE_FILE = Path(cache_dir.name) / "channels.json"
+
+    try:
+        begin = time.perf_counter()
+        if backend == "api":
+            freeboxos.record_with_api(settings, programmes)
+        else:
+            freeboxos.record_with_browser(settings, programmes)
+        total = time.perf_counter() - begin
+    finally:
+        server.shutdown()
+        cache_dir.cleanup()
+
+    # The first interval also holds the session opening (login, channels).
+    marks = [begin] + server.box.programmed_at
+    per_recording = [b - a for a, b in zip(marks, marks[1:])]
+    return len(server.box.programmed), total, per_recording
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of freeboxos.py on a fake Freebox")
+    parser.add_argument("--backend", choices=("api", "selenium"), default="api")
+    parser.add_argument("-n", "--count", type=int, default=20,
+                        help="number of recordings to program")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="delay in seconds added to every request of the fake Freebox")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Freebox OS sessions of the selenium backend")
+    parser.add_argument("--max-per-recording", type=float, default=None,
+                        help="fail when the mean time per recording is above this (seconds)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+
+    programmed, total, per_recording = run_benchmark(
+        args.backend, args.count, args.latency, args.workers
+    )
+
+    print(f"backend: {args.backend}, latency: {args.latency * 1000:.0f} ms")
+    print(f"{programmed}/{args.count} recordings programmed in {total:.3f} s")
+    if per_recording:
+        mean = statistics.mean(per_recording)
+        print(
+            f"per recording: mean {mean * 1000:.1f} ms, "
+            f"median {statistics.median(per_recording) * 1000:.1f} ms, "
+            f"max {max(per_recording) * 1000:.1f} ms "
+            f"(first one {per_recording[0] * 1000:.1f} ms with the login)"
+        )
+    else:
+        mean = None
+
+    if programmed < args.count:
+        sys.exit(1)
+    if args.max_per_recording is not None and mean > args.max_per_recording:
+        print(f"mean time per recording above {args.max_per_recording} s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
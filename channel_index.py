@@ -0,0 +1,162 @@
+"""
+Index of the channels of the Freebox, used to turn a media-select channel
+name into the exact Freebox channel (number and uuid).
+
+The channel list is read from the Freebox (tv/bouquets/freeboxtv/channels/)
+at most once per CHANNEL_CACHE_TTL and kept in channels.json. A name is
+resolved by the Freebox channel name first, then by the number of
+channels_free.py. Several media-select names share a number in
+channels_free.py (e.g. C8 and LA CHAINE PARLEMENTAIRE on "8"): such a name
+is only resolved by number when the Freebox channel of that number is not
+one of the other names.
+"""
+import json
+import logging
+import re
+import time
+import unicodedata
+
+from collections import defaultdict
+
+from channels_free import CHANNELS_FREE
+from config_freeboxos import BASE_DIR
+
+logger = logging.getLogger("module_freeboxos")
+
+CHANNEL_CACHE_FILE = BASE_DIR / "channels.json"
+CHANNEL_CACHE_TTL = 24 * 3600  # seconds
+
+
+def normalize_channel_name(name):
+    """'Chaîne  Parlementaire' -> 'CHAINE PARLEMENTAIRE'"""
+    name = unicodedata.normalize("NFKD", name or "")
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^0-9A-Z+]+", " ", name.upper()).split())
+
+
+def _colliding_names():
+    names_by_number = defaultdict(set)
+    for name, number in CHANNELS_FREE.items():
+        names_by_number[number].add(name)
+    return {
+        number: {normalize_channel_name(name) for name in names}
+        for number, names in names_by_number.items()
+        if len(names) > 1
+    }
+
+
+# number -> normalized media-select names sharing it in channels_free.py
+COLLIDING_NAMES = _colliding_names()
+
+
+class ChannelIndex:
+    """Freebox channels by number and by normalized name."""
+
+    def __init__(self, channels):
+        self.by_number = {}
+        self.by_name = {}
+        for channel in channels or []:
+            if channel.get("sub_number"):
+                continue
+            number = str(channel["number"])
+            self.by_number.setdefault(number, channel)
+            if channel.get("name"):
+                self.by_name.setdefault(normalize_channel_name(channel["name"]), channel)
+
+    def __len__(self):
+        return len(self.by_number)
+
+    def channel_uuids(self):
+        """channel number -> uuid, as freebox_api.channel_uuids_from_bouquet()."""
+        return {number: channel["uuid"] for number, channel in self.by_number.items()}
+
+    def _resolve(self, media_name):
+        """Return (channel or None, True when the Freebox name confirms it)."""
+        normalized = normalize_channel_name(media_name)
+        channel = self.by_name.get(normalized)
+        if channel is not None:
+            return channel, True
+
+        number = CHANNELS_FREE.get(media_name)
+        channel = self.by_number.get(number)
+        if channel is None:
+            return None, False
+        others = COLLIDING_NAMES.get(number, set()) - {normalized}
+        if normalize_channel_name(channel.get("name")) in others:
+            # The Freebox channel of this number is another media-select name.
+            return None, False
+        return channel, number not in COLLIDING_NAMES
+
+    def resolve(self, media_name):
+        """Return the Freebox channel of a media-select channel name, or None."""
+        return self._resolve(media_name)[0]
+
+    def check(self, media_names):
+        """
+        Log once the channel names which cannot be resolved and the ones only
+        resolved through a number shared by several names. Return the set of
+        unresolved names.
+        """
+        unknown = set()
+        for media_name in sorted(set(media_names)):
+            channel, confirmed = self._resolve(media_name)
+            if channel is None:
+                unknown.add(media_name)
+                logger.error(
+                    "La chaine %s n'a pas été trouvée dans la liste des chaînes "
+                    "de la Freebox. Ses programmes ne seront pas enregistrés.",
+                    media_name
+                )
+            elif not confirmed:
+                logger.warning(
+                    "La chaine %s partage le numéro %s avec d'autres chaînes dans "
+                    "channels_free.py: ses programmes seront enregistrés sur la "
+                    "chaîne %s de la Freebox.",
+                    media_name, channel["number"], channel.get("name", channel["number"])
+                )
+        return unknown
+
+
+def _read_cache(cache_path):
+    try:
+        with open(cache_path, "r", encoding='utf-8') as f:
+            cache = json.load(f)
+        return cache["fetched_at"], cache["channels"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError):
+        return None, None
+
+
+def _write_cache(cache_path, channels):
+    from progweek_fetch import atomic_write
+
+    kept = [
+        {key: channel[key] for key in ("number", "sub_number", "uuid", "name") if key in channel}
+        for channel in channels
+    ]
+    try:
+        atomic_write(cache_path, json.dumps({"fetched_at": time.time(), "channels": kept}).encode())
+    except OSError as e:
+        logger.warning("Impossible d'écrire le cache des chaînes: %s", e)
+
+
+def load_channel_index(fetch_channels, cache_path=None, ttl=CHANNEL_CACHE_TTL):
+    """
+    Return the ChannelIndex of the Freebox, or None when the channel list is
+    neither cached nor readable. fetch_channels() returns the channel list
+    of the bouquet, or None on failure; it is only called when the cache is
+    missing or older than ttl seconds. A stale cache is used when the
+    Freebox does not answer.
+    """
+    cache_path = cache_path or CHANNEL_CACHE_FILE
+    fetched_at, channels = _read_cache(cache_path)
+    if channels is not None and time.time() - fetched_at < ttl:
+        return ChannelIndex(channels)
+
+    fresh = fetch_channels()
+    if fresh:
+        _write_cache(cache_path, fresh)
+        return ChannelIndex(fresh)
+    if channels is not None:
+        logger.warning("Liste des chaînes de la Freebox illisible: utilisation du cache.")
+        return ChannelIndex(channels)
+    return None
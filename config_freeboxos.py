@@ -0,0 +1,132 @@
+import json
+import os
+import re
+
+from dataclasses import dataclass, field
+from pathlib import Path
+
+BASE_DIR = Path.home() / ".local" / "share" / "select_freeboxos"
+LOG_FILE = BASE_DIR / "logs" / "select_freeboxos.log"
+INFO_PROGS_FILE = BASE_DIR / "info_progs.json"
+INFO_PROGS_LAST_FILE = BASE_DIR / "info_progs_last.json"
+PROGS_TO_RECORD_FILE = BASE_DIR / "progs_to_record.json"
+PROGS_TO_UPDATE_FILE = BASE_DIR / "progs_to_update.json"
+GECKODRIVER_PATH = BASE_DIR / "geckodriver"
+CONFIG_PATH = Path.home() / ".config" / "select_freeboxos" / "config.json"
+
+RECORDING_BACKENDS = ("selenium", "api")
+
+
+class ConfigError(Exception):
+    """config.json or the keyring does not provide a usable configuration."""
+
+
+@dataclass
+class Settings:
+    admin_password: str
+    freebox_server_ip: str
+    media_select_titles: bool
+    max_sim_recordings: int
+    https: bool
+    sentry_monitoring_sdk: bool
+    crypted_credentials: bool = False
+    security_strict_mode: bool = True
+    recording_backend: str = "selenium"
+    freebox_app_token: str = None
+    wait_timeouts: dict = field(default_factory=dict)
+    queued_logging: bool = False
+    browser_workers: int = 1
+
+    def secrets(self):
+        """Values which must never appear in logs."""
+        return {
+            "admin_password": self.admin_password,
+            "freebox_ip": self.freebox_server_ip,
+            "app_token": self.freebox_app_token,
+        }
+
+
+def get_validated_user():
+    """Securely get and validate the USER environment variable."""
+    user = os.getenv("USER")
+    if not user:
+        raise ValueError("USER environment variable is not set")
+    if not re.match(r'^[a-zA-Z0-9_-]+$', user):
+        raise ValueError(f"Invalid USER environment variable: contains unsafe characters")
+    home_path = Path.home()
+    expected_home = Path(f"/home/{user}")
+    if home_path != expected_home:
+        user = home_path.name
+        if not re.match(r'^[a-zA-Z0-9_-]+$', user):
+            raise ValueError("Home directory name contains unsafe characters")
+    return user
+
+
+def validate_path_safety(path, base_dir):
+    """Ensure path doesn't escape base directory via traversal attacks."""
+    try:
+        resolved_path = path.resolve()
+        resolved_base = base_dir.resolve()
+        resolved_path.relative_to(resolved_base)
+        return resolved_path
+    except (ValueError, RuntimeError):
+        raise ValueError(f"Path {path} attempts to escape base directory {base_dir}")
+
+
+def load_settings(config_path=CONFIG_PATH):
+    """
+    Read config.json. When CRYPTED_CREDENTIALS is set, the credentials are
+    placeholders until load_keyring_credentials() is called.
+    """
+    try:
+        with config_path.open(encoding='utf-8') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        raise ConfigError("ERROR: config.json not found")
+    except json.JSONDecodeError as e:
+        raise ConfigError(f"ERROR: invalid config.json: {e}")
+
+    try:
+        settings = Settings(
+            admin_password=config["ADMIN_PASSWORD"],
+            freebox_server_ip=config["FREEBOX_SERVER_IP"],
+            media_select_titles=bool(config["MEDIA_SELECT_TITLES"]),
+            max_sim_recordings=int(config["MAX_SIM_RECORDINGS"]),
+            https=bool(config["HTTPS"]),
+            sentry_monitoring_sdk=bool(config["SENTRY_MONITORING_SDK"]),
+            crypted_credentials=bool(config.get("CRYPTED_CREDENTIALS", False)),
+            security_strict_mode=bool(config.get("SECURITY_STRICT_MODE", True)),
+            recording_backend=config.get("RECORDING_BACKEND", "selenium"),
+            freebox_app_token=config.get("FREEBOX_APP_TOKEN"),
+            wait_timeouts=config.get("WAIT_TIMEOUTS") or {},
+            queued_logging=bool(config.get("QUEUED_LOGGING", False)),
+            browser_workers=int(config.get("BROWSER_WORKERS", 1)),
+        )
+    except KeyError as e:
+        raise ConfigError(f"ERROR: missing config key: {e}")
+    except (TypeError, ValueError) as e:
+        raise ConfigError(f"ERROR: invalid config value: {e}")
+
+    if settings.recording_backend not in RECORDING_BACKENDS:
+        raise ConfigError(f"ERROR: invalid RECORDING_BACKEND: {settings.recording_backend}")
+    if settings.browser_workers < 1:
+        raise ConfigError(f"ERROR: invalid BROWSER_WORKERS: {settings.browser_workers}")
+
+    return settings
+
+
+def load_keyring_credentials(settings):
+    """Replace the placeholders of config.json by the crypted credentials."""
+    try:
+        import keyring
+        settings.freebox_server_ip = keyring.get_password("freeboxos", "username")
+        settings.admin_password = keyring.get_password("freeboxos", "password")
+        if settings.recording_backend == "api":
+            settings.freebox_app_token = keyring.get_password("freeboxos", "app_token")
+    except Exception:
+        raise ConfigError("An error occurred while retrieving credentials from keyring.")
+
+    if settings.freebox_server_ip is None:
+        raise ConfigError("Failed to retrieve 'username' from keyring for 'freeboxos'.")
+    if settings.admin_password is None:
+        raise ConfigError("Failed to retrieve 'password' from keyring for 'freeboxos'.")
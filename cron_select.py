@@ -1,172 +1,273 @@
+import argparse
+import fcntl
 import logging
 import json
-import keyring
+import netrc
 import os
-import requests
+import signal
 import sys
 
+from datetime import datetime, timedelta
 from pathlib import Path
-from subprocess import Popen, PIPE, run
-from datetime import datetime
-from logging.handlers import RotatingFileHandler
+from zoneinfo import ZoneInfo
 
-user = os.getenv("USER")
+import freeboxos
 
-log_file = f"/home/{user}/.local/share/select_freeboxos/logs/select_freeboxos.log"
-max_bytes = 10 * 1024 * 1024  # 10 MB
-backup_count = 5
-log_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count)
-
-log_format = '%(asctime)s %(levelname)s %(message)s'
-log_datefmt = '%d-%m-%Y %H:%M:%S'
-formatter = logging.Formatter(log_format, log_datefmt)
-
-log_handler.setFormatter(formatter)
-
-logger = logging.getLogger()
-logger.addHandler(log_handler)
-
-logger.setLevel(logging.INFO)
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s %(levelname)s %(message)s',
-                    datefmt='%d-%m-%Y %H:%M:%S',
-                    handlers=[log_handler])
-
-config_path = Path.home() / ".config" / "select_freeboxos" / "config.json"
-
-try:
-    with config_path.open(encoding='utf-8') as f:
-        config = json.load(f)
-except FileNotFoundError:
-    logger.error("Missing config.json file")
-    sys.exit(1)
-except json.JSONDecodeError:
-    logger.error("Invalid JSON in config.json")
-    sys.exit(1)
-
-CRYPTED_CREDENTIALS = bool(config.get("CRYPTED_CREDENTIALS", False))
-
-def get_file_modification_time(file_path):
-    try:
-        mod_time = os.path.getmtime(file_path)
-        return datetime.fromtimestamp(mod_time)
-    except FileNotFoundError:
-        logger.error(f"File not found: {file_path}")
-        return None
-
-def remove_items(INFO_PROGS, INFO_PROGS_LAST, PROGS_TO_RECORD):
-    # Remove items already set to be recorded
+from config_freeboxos import (
+    BASE_DIR,
+    INFO_PROGS_FILE,
+    PROGS_TO_RECORD_FILE,
+    PROGS_TO_UPDATE_FILE,
+    ConfigError,
+    load_settings,
+)
+from file_watch import FileWatcher
+from freeboxos_daemon import submit_batch
+from progs_diff import diff_programmes
+from progs_stream import iter_programmes
+from security_sanitizer import global_sanitizer
+from state_store import StateStore
+
+logger = logging.getLogger("module_freeboxos")
+
+API_HOST = "www.media-select.fr"
+API_URL = f"https://{API_HOST}/api/v1/progweek"
+NETRC_PATH = Path.home() / ".netrc"
+PROGWEEK_VALIDATORS = BASE_DIR / "progweek_validators.json"
+RUN_LOCK_FILE = BASE_DIR / "freeboxos.lock"
+FEED_MAX_AGE = 1800  # seconds
+RETRY_INTERVAL = 600  # seconds, between two failed downloads in --watch mode
+
+def remove_items(INFO_PROGS, store, PROGS_TO_RECORD, PROGS_TO_UPDATE=None):
+    # Remove items already set to be recorded, i.e. in the feed of the last
+    # successful run kept by `store` (a StateStore). Programmes whose fields
+    # changed since the last run are written to PROGS_TO_UPDATE instead.
+    # Both feeds are read programme by programme, keeping only the ones
+    # which are not over yet.
+    now = datetime.now(ZoneInfo("Europe/Paris"))
+    items_to_remove = store.programmes(not_before=now)
+
+    # Return the diff, or None when info_progs.json is missing or invalid.
     try:
-        with open(INFO_PROGS, 'r', encoding='utf-8') as f:
-            source_data = json.load(f)
+        diff = diff_programmes(iter_programmes(INFO_PROGS, not_before=now), items_to_remove)
     except FileNotFoundError:
         logger.error(
         "No info_progs.json file. Need to check curl command or "
         "internet connection. Exit programme."
         )
-        exit()
+        return None
     except json.decoder.JSONDecodeError:
         logger.error(
         "JSONDecodeError in info_progs.json file. Need to check curl command or "
         "internet connection. Exit programme."
         )
-        exit()
+        return None
+
+    with open(PROGS_TO_RECORD, 'w', encoding='utf-8') as f:
+        json.dump([programme.record for programme in diff.added], f, indent=4)
 
+    if PROGS_TO_UPDATE is not None:
+        with open(PROGS_TO_UPDATE, 'w', encoding='utf-8') as f:
+            json.dump([programme.record for programme in diff.modified], f, indent=4)
+
+    logger.info(
+        "%d new, %d modified and %d unchanged programmes.",
+        len(diff.added), len(diff.modified), len(diff.unchanged)
+    )
+    return diff
+
+def netrc_credentials(host=API_HOST):
+    """Return (login, password) of host in ~/.netrc, or None."""
     try:
-        with open(INFO_PROGS_LAST, 'r', encoding='utf-8') as f:
-            items_to_remove = json.load(f)
+        authenticators = netrc.netrc(str(NETRC_PATH)).authenticators(host)
+    except (FileNotFoundError, netrc.NetrcParseError) as e:
+        logger.error(f"Cannot read .netrc file: {type(e).__name__}")
+        return None
+    if authenticators is None:
+        return None
+    login, _, password = authenticators
+    return login, password
+
+def media_select_credentials(crypted_credentials):
+    """Return the (username, password) used for the progweek API."""
+    if crypted_credentials:
+        import keyring
+        username = keyring.get_password("media-select", "username")
+        password = keyring.get_password("media-select", "password")
+
+        if username is None or password is None:
+            logger.error("Keyring is locked or credentials are not set. Please unlock the keyring and try again.")
+            raise ValueError("Keyring is locked or credentials are not set.")
+        return username, password
+
+    credentials = netrc_credentials()
+    if credentials is None:
+        raise ValueError(f"No credentials for {API_HOST} in .netrc file.")
+    return credentials
+
+def needs_download(now, store):
+    """
+    Download the feed when the last successful run is older than today and
+    info_progs.json is missing, empty or older than 30 minutes.
+    """
+    last_run = store.last_successful_run()
+    if last_run is not None and datetime.fromtimestamp(last_run).date() >= now.date():
+        return False
+
+    try:
+        stat_result = os.stat(INFO_PROGS_FILE)
+    except FileNotFoundError:
+        return True
+    time_diff = now - datetime.fromtimestamp(stat_result.st_mtime)
+    return time_diff.total_seconds() > FEED_MAX_AGE or stat_result.st_size == 0
+
+def next_download_time(now, store):
+    """The time from which needs_download() is true, `now` at the earliest."""
+    last_run = store.last_successful_run()
+    if last_run is not None and datetime.fromtimestamp(last_run).date() >= now.date():
+        return datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    try:
+        stat_result = os.stat(INFO_PROGS_FILE)
     except FileNotFoundError:
-        items_to_remove = []
+        return now
+    if stat_result.st_size == 0:
+        return now
+    return max(now, datetime.fromtimestamp(stat_result.st_mtime) + timedelta(seconds=FEED_MAX_AGE))
 
-    modified_data = [item for item in source_data if item not in items_to_remove]
+def download_programmes(settings):
+    """Download info_progs.json from media-select when it changed."""
+    import requests
+    from progweek_fetch import fetch_progweek
 
-    with open(PROGS_TO_RECORD, 'w', encoding='utf-8') as f:
-        json.dump(modified_data, f, indent=4)
-
-OUTPUT_FILE = os.path.expanduser("~/.local/share/select_freeboxos/info_progs.json")
-API_URL = "https://www.media-select.fr/api/v1/progweek"
-INFO_PROGS = f"/home/{user}/.local/share/select_freeboxos/info_progs.json"
-INFO_PROGS_LAST = (f"/home/{user}/.local/share/select_freeboxos/"
-                   "info_progs_last.json")
-PROGS_TO_RECORD = (f"/home/{user}/.local/share/select_freeboxos/"
-                   "progs_to_record.json")
-
-if not CRYPTED_CREDENTIALS:
-    netrc_path = os.path.expanduser("~/.netrc")
-    if not os.path.exists(netrc_path):
+    try:
+        auth = media_select_credentials(settings.crypted_credentials)
+        global_sanitizer.update_patterns({
+            "media_select_username": auth[0],
+            "media_select_password": auth[1],
+        })
+        status = fetch_progweek(INFO_PROGS_FILE, PROGWEEK_VALIDATORS, auth=auth, url=API_URL)
+        logger.info(f"progweek download: {status}.")
+    except requests.RequestException as e:
+        logger.error(f"API request failed: {e}", exc_info=False)
+    except ValueError as e:
+        logger.error(f"Error: {e}")
+
+def schedule_programmes(handle_sigterm=True):
+    """Program progs_to_record.json with the daemon, or in this process."""
+    if submit_batch():
+        logger.info("New programmes submitted to the freeboxos daemon.")
+    else:
+        run_freeboxos(handle_sigterm)
+
+def run_freeboxos(handle_sigterm=True):
+    """Program the new recordings in this process, one run at a time."""
+    with open(RUN_LOCK_FILE, "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info("A freeboxos run is already in progress.")
+            return
+        if handle_sigterm:
+            freeboxos.handle_sigterm()
+        settings = freeboxos.prepare_settings()
+        freeboxos.run(settings)
+
+def watch(settings):
+    """
+    Resident mode: wait for a change of info_progs.json or
+    progs_to_record.json (inotify, see file_watch.py) or for the time of
+    the next download, and run the matching part of the pipeline at once.
+    A SIGTERM during a run stops it after the current programme, then the
+    watch ends; when idle, the watch ends at once.
+    """
+    busy = False
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        if not busy:
+            sys.exit(0)
+        logger.warning("SIGTERM reçu: arrêt après le programme en cours.")
+        freeboxos.RUN_STOP.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    watcher = FileWatcher(BASE_DIR, {INFO_PROGS_FILE.name, PROGS_TO_RECORD_FILE.name})
+    logger.info("Watching %s for new programmes.", BASE_DIR.name)
+    retry_at = None
+    changed = set()
+    try:
+        while not stopping:
+            now = datetime.now()
+            busy = True
+            with StateStore() as store:
+                due = needs_download(now, store) and (retry_at is None or now >= retry_at)
+                if due:
+                    download_programmes(settings)
+                    # Try again like the former 10 minutes cron when the feed
+                    # could not be downloaded.
+                    retry_at = now + timedelta(seconds=RETRY_INTERVAL)
+                    changed.add(INFO_PROGS_FILE.name)
+                if INFO_PROGS_FILE.name in changed:
+                    if remove_items(
+                        INFO_PROGS_FILE, store, PROGS_TO_RECORD_FILE, PROGS_TO_UPDATE_FILE
+                    ) is None:
+                        changed.clear()
+                    else:
+                        changed.add(PROGS_TO_RECORD_FILE.name)
+                wake_at = next_download_time(now, store)
+            if PROGS_TO_RECORD_FILE.name in changed and not stopping:
+                schedule_programmes(handle_sigterm=False)
+            watcher.drain()
+            busy = False
+            if stopping:
+                # SIGTERM came during the run: do not wait for the next change.
+                break
+
+            if retry_at is not None and wake_at <= retry_at:
+                wake_at = retry_at
+            timeout = (wake_at - datetime.now()).total_seconds()
+            changed = watcher.wait(timeout)
+    finally:
+        watcher.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Download the media-select programmes and program the new ones."
+    )
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="stay resident and react to changes of the programme files",
+    )
+    args = parser.parse_args(argv)
+
+    freeboxos.setup_logging(stream=False)
+
+    try:
+        settings = load_settings()
+    except ConfigError as e:
+        logger.error(str(e))
+        sys.exit(1)
+    if settings.queued_logging:
+        freeboxos.enable_queued_logging()
+
+    if not settings.crypted_credentials and not NETRC_PATH.exists():
         logger.error("No .netrc file. Exit program")
         exit()
 
-stat_result = run(
-    ["/usr/bin/stat", "-c", "%Y-%s", INFO_PROGS],
-    capture_output=True,
-    text=True,
-    check=False
-)
-error_file = stat_result.stderr.strip()
-
-if error_file == "":
-    info_file = stat_result.stdout.strip().split("-")
-    time_file = datetime.fromtimestamp(int(info_file[0]))
-    time_diff = datetime.now() - time_file
-    size_file = int(info_file[1])
-
-
-info_progs_last_mod_time = get_file_modification_time(INFO_PROGS_LAST)
-
-if info_progs_last_mod_time is None or info_progs_last_mod_time.date() < datetime.now().date():
-    if error_file != "" or time_diff.total_seconds() > 1800 or size_file == 0:
-        if CRYPTED_CREDENTIALS:
-            try:
-                username = keyring.get_password("media-select", "username")
-                password = keyring.get_password("media-select", "password")
-
-                if username is None or password is None:
-                    logger.error("Keyring is locked or credentials are not set. Please unlock the keyring and try again.")
-                    raise ValueError("Keyring is locked or credentials are not set.")
-
-                response = requests.get(
-                            API_URL,
-                            auth=(username, password),
-                            headers={"Accept": "application/json; indent=4"},
-                            timeout=10,
-                        )
-
-                response.raise_for_status()
-
-                with open(OUTPUT_FILE, "w", encoding='utf-8') as f:
-                    f.write(response.text)
-
-                logger.info("Data downloaded with requests successfully.")
-
-            except requests.RequestException as e:
-                logger.error(f"API request failed: {e}", exc_info=False)
-            except ValueError as e:
-                logger.error(f"Error: {e}")
-        else:
-            try:
-                curl_result = run(
-                    [
-                        "/usr/bin/curl",
-                        "-H", "Accept: application/json;indent=4",
-                        "-n",
-                        API_URL,
-                    ],
-                    stdout=PIPE,
-                    stderr=PIPE,
-                    text=False,  # Keep as bytes
-                    check=False
-                )
-
-                with open(INFO_PROGS, "wb") as json_file:
-                    json_file.write(curl_result.stdout)
-
-                logger.info("Data downloaded with curl successfully.")
-
-            except Exception as e:
-                logger.error(f"Error: {str(e)}\n")
-
-        remove_items(INFO_PROGS, INFO_PROGS_LAST, PROGS_TO_RECORD)
-
-        cmd = ["/bin/bash", "cron_freeboxos_app.sh"]
-        Popen(cmd, cwd=f"/home/{user}/select-freeboxos", stdout=PIPE, stderr=PIPE)
+    if args.watch:
+        watch(settings)
+        return
+
+    with StateStore() as store:
+        if not needs_download(datetime.now(), store):
+            return
+        download_programmes(settings)
+        if remove_items(INFO_PROGS_FILE, store, PROGS_TO_RECORD_FILE, PROGS_TO_UPDATE_FILE) is None:
+            sys.exit()
+
+    schedule_programmes()
+
+
+if __name__ == "__main__":
+    main()
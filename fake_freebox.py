@@ -0,0 +1,466 @@
+"""
+Local stand-in for the parts of Freebox OS used by select-freeboxos.
+
+It allows running the programme without a real Freebox:
+
+    python3 fake_freebox.py --port 8080 --app-token test-token --admin-password admin
+
+then set FREEBOX_SERVER_IP to "127.0.0.1:8080" and HTTPS to false in
+config.json, with either RECORDING_BACKEND "api" and FREEBOX_APP_TOKEN
+"test-token", or RECORDING_BACKEND "selenium" and ADMIN_PASSWORD "admin".
+
+The web interface only reproduces what the Selenium flow touches: the
+fbx-password login field, the "Programmer un enregistrement" form
+(channel_uuid, date, start_time, end_time, name, "Sauvegarder" and
+"Annuler") and the "Identifiants invalides" / "Erreur interne" banners.
+"""
+import argparse
+import hashlib
+import hmac
+import itertools
+import json
+import secrets
+import threading
+import time
+
+from datetime import datetime, timedelta
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from zoneinfo import ZoneInfo
+
+from channels_free import CHANNELS_FREE
+
+API_ROOT = "/api/v8/"
+SESSION_COOKIE = "FREEBOXOS"
+PARIS_TZ = ZoneInfo("Europe/Paris")
+DATE_PICKER_DAYS = 14
+
+WEEKDAYS_FR = ["Lun.", "Mar.", "Mer.", "Jeu.", "Ven.", "Sam.", "Dim."]
+MONTHS_FR = ["Jan", "Fév", "Mar", "Avr", "Mai", "Juin", "Juil", "Août", "Sept", "Oct", "Nov", "Déc"]
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Freebox OS</title>
+<style>
+.hidden { display: none; }
+#record-form input { display: block; margin: 4px; }
+</style>
+</head>
+<body>
+<div id="login" class="%(login_class)s">
+  <input id="fbx-password" type="password" autocomplete="off">
+</div>
+<div id="pvr" class="%(pvr_class)s">
+  <button id="programmer"><span>Programmer un enregistrement</span></button>
+</div>
+<script>
+var CHANNELS = %(channels)s;
+var DAYS = %(days)s;
+var LATENCY_MS = %(latency_ms)d;
+
+function later(callback) { setTimeout(callback, LATENCY_MS); }
+
+function banner(parent, text) {
+  var div = document.createElement("div");
+  div.className = "banner";
+  div.textContent = text;
+  parent.appendChild(div);
+}
+
+function post(path, payload) {
+  return fetch(path, {
+    method: "POST",
+    credentials: "same-origin",
+    headers: {"Content-Type": "application/json"},
+    body: JSON.stringify(payload)
+  }).then(function (response) { return response.json(); });
+}
+
+document.getElementById("fbx-password").addEventListener("keydown", function (event) {
+  if (event.key !== "Enter") { return; }
+  var old = document.querySelector("#login .banner");
+  if (old) { old.remove(); }
+  post("/login.php", {password: this.value}).then(function (body) {
+    if (body.success) {
+      document.getElementById("login").className = "hidden";
+      document.getElementById("pvr").className = "";
+    } else {
+      banner(document.getElementById("login"), "Identifiants invalides");
+    }
+  });
+});
+
+function field(form, name) {
+  var input = document.createElement("input");
+  input.name = name;
+  input.autocomplete = "off";
+  form.appendChild(input);
+  return input;
+}
+
+function button(form, text, callback) {
+  var element = document.createElement("button");
+  var span = document.createElement("span");
+  span.textContent = text;
+  element.appendChild(span);
+  element.addEventListener("click", callback);
+  form.appendChild(element);
+}
+
+function openForm() {
+  if (document.getElementById("record-form")) { return; }
+  var form = document.createElement("div");
+  form.id = "record-form";
+  var channel = field(form, "channel_uuid");
+  var date = field(form, "date");
+  date.readOnly = true;
+  field(form, "start_time");
+  field(form, "end_time");
+  field(form, "name");
+
+  channel.addEventListener("keydown", function (event) {
+    if (event.key !== "Enter") { return; }
+    var number = channel.value.split("/")[0].trim();
+    later(function () {
+      if (CHANNELS[number]) { channel.value = number + "/" + CHANNELS[number]; }
+    });
+  });
+
+  date.addEventListener("click", function () {
+    if (document.getElementById("date-picker")) { return; }
+    later(function () {
+      var list = document.createElement("ul");
+      list.id = "date-picker";
+      DAYS.forEach(function (day) {
+        var item = document.createElement("li");
+        item.textContent = day[0];
+        item.addEventListener("click", function () {
+          date.value = day[1];
+          list.remove();
+        });
+        list.appendChild(item);
+      });
+      form.insertBefore(list, date.nextSibling);
+    });
+  });
+
+  button(form, "Sauvegarder", function () {
+    var payload = {};
+    ["channel_uuid", "date", "start_time", "end_time", "name"].forEach(function (name) {
+      payload[name] = form.querySelector("input[name=" + name + "]").value;
+    });
+    var old = form.querySelector(".banner");
+    if (old) { old.remove(); }
+    post("/pvr/record", payload).then(function (body) {
+      if (body.success) {
+        form.remove();
+      } else if (body.error_code === "internal_error") {
+        banner(form, "Erreur interne");
+      } else {
+        banner(form, body.msg || body.error_code);
+      }
+    });
+  });
+  button(form, "Annuler", function () { later(function () { form.remove(); }); });
+
+  document.getElementById("pvr").appendChild(form);
+}
+
+document.getElementById("programmer").addEventListener("click", function () { later(openForm); });
+</script>
+</body>
+</html>
+"""
+
+
+def date_picker_days(today):
+    """Labels of the date picker of the recording form and their ISO date."""
+    days = []
+    for offset in range(DATE_PICKER_DAYS):
+        day = today + timedelta(days=offset)
+        if offset == 0:
+            label = "Aujourd'hui"
+        elif offset == 1:
+            label = "Demain"
+        elif offset == 2:
+            label = "Dans 2 jours"
+        else:
+            label = f"{WEEKDAYS_FR[day.weekday()]} {day:%d} {MONTHS_FR[day.month - 1]}"
+        days.append((label, day.isoformat()))
+    return days
+
+
+class FakeFreebox:
+    """In-memory state of the fake Freebox (session, channels, PVR)."""
+
+    def __init__(self, app_token="test-token", latency=0.0, grant_authorization=True,
+                 admin_password="admin", disk_full_after=None):
+        self.app_token = app_token
+        self.latency = latency
+        self.grant_authorization = grant_authorization
+        self.admin_password = admin_password
+        # Number of recordings after which the Freebox answers "internal_error"
+        # (full disk); None: never.
+        self.disk_full_after = disk_full_after
+        self.challenge = secrets.token_hex(16)
+        self.session_tokens = set()
+        self.ui_sessions = set()
+        self.channel_names = {}
+        for name, number in CHANNELS_FREE.items():
+            self.channel_names.setdefault(number, name)
+        self.channels = [
+            {"number": int(number), "sub_number": 0, "uuid": f"uuid-webtv-{number}",
+             "name": self.channel_names[number], "available": True}
+            for number in sorted(self.channel_names, key=int)
+        ]
+        self.programmed = []
+        # time.perf_counter() of each accepted recording, for the benchmarks
+        self.programmed_at = []
+        self._ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def expected_password(self):
+        return hmac.new(
+            self.app_token.encode(), self.challenge.encode(), hashlib.sha1
+        ).hexdigest()
+
+    def add_programmed(self, payload):
+        channel_uuids = {channel["uuid"] for channel in self.channels}
+        if payload.get("channel_uuid") not in channel_uuids:
+            return None, "invalid_request"
+        if payload.get("end", 0) <= payload.get("start", 0):
+            return None, "invalid_request"
+        with self.lock:
+            if self.disk_full_after is not None and len(self.programmed) >= self.disk_full_after:
+                return None, "internal_error"
+            record = {
+                "id": next(self._ids),
+                "channel_uuid": payload["channel_uuid"],
+                "start": payload["start"],
+                "end": payload["end"],
+                "name": payload.get("name") or payload["channel_uuid"],
+                "state": "waiting_start_time",
+            }
+            self.programmed.append(record)
+            self.programmed_at.append(time.perf_counter())
+        return record, None
+
+    def add_programmed_from_form(self, form):
+        """Program a recording from the fields of the web interface form."""
+        number = form.get("channel_uuid", "").split("/")[0].strip()
+        if number not in self.channel_names:
+            return None, "invalid_request"
+        try:
+            day = datetime.strptime(form.get("date", ""), "%Y-%m-%d")
+            start_time = datetime.strptime(form.get("start_time", ""), "%H:%M")
+            end_time = datetime.strptime(form.get("end_time", ""), "%H:%M")
+        except ValueError:
+            return None, "invalid_request"
+        start = day.replace(hour=start_time.hour, minute=start_time.minute, tzinfo=PARIS_TZ)
+        end = day.replace(hour=end_time.hour, minute=end_time.minute, tzinfo=PARIS_TZ)
+        if end <= start:
+            end += timedelta(days=1)
+        return self.add_programmed({
+            "channel_uuid": f"uuid-webtv-{number}",
+            "start": int(start.timestamp()),
+            "end": int(end.timestamp()),
+            "name": form.get("name") or self.channel_names[number],
+        })
+
+    def page(self, logged_in):
+        today = datetime.now(PARIS_TZ).date()
+        return (PAGE_TEMPLATE % {
+            "login_class": "hidden" if logged_in else "",
+            "pvr_class": "" if logged_in else "hidden",
+            "channels": json.dumps(self.channel_names),
+            "days": json.dumps(date_picker_days(today)),
+            "latency_ms": int(self.latency * 1000),
+        }).encode()
+
+    def update_programmed(self, recording_id, payload):
+        with self.lock:
+            for record in self.programmed:
+                if str(record["id"]) == recording_id:
+                    if payload.get("name"):
+                        record["name"] = payload["name"]
+                    return record
+        return None
+
+
+class FakeFreeboxHandler(BaseHTTPRequestHandler):
+    server_version = "FakeFreebox/1.0"
+
+    @property
+    def box(self):
+        return self.server.box
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _ok(self, result=None):
+        self._send({"success": True, "result": result})
+
+    def _error(self, error_code, status=403, msg=""):
+        self._send({"success": False, "error_code": error_code, "msg": msg}, status)
+
+    def _payload(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _ui_session(self):
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        morsel = cookie.get(SESSION_COOKIE)
+        return morsel is not None and morsel.value in self.box.ui_sessions
+
+    def _authenticated(self):
+        # The web interface calls the API with its session cookie.
+        return self.headers.get("X-Fbx-App-Auth") in self.box.session_tokens or self._ui_session()
+
+    def _ui_login(self):
+        if self._payload().get("password") != self.box.admin_password:
+            return self._error("invalid_password", msg="Identifiants invalides")
+        token = secrets.token_hex(16)
+        self.box.ui_sessions.add(token)
+        body = json.dumps({"success": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Set-Cookie", f"{SESSION_COOKIE}={token}; Path=/; HttpOnly")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self, method):
+        if self.box.latency:
+            time.sleep(self.box.latency)
+        path = urlsplit(self.path).path
+
+        if path in ("/", "/login.php") and method == "GET":
+            body = self.box.page(self._ui_session())
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if path == "/login.php" and method == "POST":
+            return self._ui_login()
+        if path == "/pvr/record" and method == "POST":
+            if not self._ui_session():
+                return self._error("auth_required", msg="Authentication required")
+            record, error = self.box.add_programmed_from_form(self._payload())
+            if error:
+                return self._error(error, 400)
+            return self._ok(record)
+        if path == "/api_version":
+            return self._send({
+                "api_base_url": "/api/",
+                "api_version": "8.0",
+                "device_name": "Freebox Server (fake)",
+                "https_available": False,
+            })
+        if not path.startswith(API_ROOT):
+            return self._error("not_found", 404)
+
+        route = path[len(API_ROOT):]
+        if route == "login/" and method == "GET":
+            return self._ok({"logged_in": self._authenticated(), "challenge": self.box.challenge})
+        if route == "login/session/" and method == "POST":
+            if self._payload().get("password") != self.box.expected_password():
+                return self._error("invalid_token", msg="The app token is invalid")
+            token = secrets.token_hex(16)
+            self.box.session_tokens.add(token)
+            return self._ok({"session_token": token, "permissions": {"pvr": True, "tv": True}})
+        if route == "login/authorize/" and method == "POST":
+            return self._ok({"app_token": self.box.app_token, "track_id": 1})
+        if route.startswith("login/authorize/") and method == "GET":
+            status = "granted" if self.box.grant_authorization else "denied"
+            return self._ok({"status": status, "challenge": self.box.challenge})
+
+        if not self._authenticated():
+            return self._error("auth_required", msg="Authentication required")
+
+        if route == "tv/bouquets/freeboxtv/channels/" and method == "GET":
+            return self._ok(self.box.channels)
+        if route == "pvr/programmed/" and method == "GET":
+            with self.box.lock:
+                return self._ok(list(self.box.programmed))
+        if route == "pvr/programmed/" and method == "POST":
+            record, error = self.box.add_programmed(self._payload())
+            if error:
+                return self._error(error, 400)
+            return self._ok(record)
+        if route.startswith("pvr/programmed/") and method == "PUT":
+            record = self.box.update_programmed(route.rsplit("/", 1)[-1], self._payload())
+            if record is None:
+                return self._error("noent", 404)
+            return self._ok(record)
+        return self._error("not_found", 404)
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PUT(self):
+        self._route("PUT")
+
+
+def start_fake_freebox(host="127.0.0.1", port=0, **kwargs):
+    """
+    Start a fake Freebox in a background thread.
+    Return the server; its address is server.server_address and it is
+    stopped with server.shutdown().
+    """
+    server = ThreadingHTTPServer((host, port), FakeFreeboxHandler)
+    server.daemon_threads = True
+    server.box = FakeFreebox(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Freebox OS server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--app-token", default="test-token")
+    parser.add_argument("--admin-password", default="admin")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="delay in seconds added to every request")
+    parser.add_argument("--disk-full-after", type=int, default=None,
+                        help="answer 'Erreur interne' after this number of recordings")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), FakeFreeboxHandler)
+    server.box = FakeFreebox(
+        app_token=args.app_token,
+        latency=args.latency,
+        admin_password=args.admin_password,
+        disk_full_after=args.disk_full_after,
+    )
+    print(f"Fake Freebox listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Wait for changes of some files of a directory, with inotify.
+
+The directory is watched rather than the files, as the programme files are
+replaced by a rename (progweek_fetch.atomic_write). inotify is used through
+ctypes; where it is not available, the files are polled every
+POLL_INTERVAL seconds instead.
+
+    watcher = FileWatcher(BASE_DIR, {"info_progs.json", "progs_to_record.json"})
+    changed = watcher.wait(timeout)  # names of the changed files, empty on timeout
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+
+logger = logging.getLogger("module_freeboxos")
+
+DEBOUNCE = 2.0  # seconds without change before a burst is reported
+POLL_INTERVAL = 60  # seconds, without inotify
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def _inotify_watch(directory):
+    """Return an inotify file descriptor watching `directory`, or None."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+class FileWatcher:
+    def __init__(self, directory, names, debounce=DEBOUNCE):
+        self.directory = directory
+        self.names = set(names)
+        self.debounce = debounce
+        self._fd = _inotify_watch(directory)
+        if self._fd is None:
+            logger.warning(
+                "inotify indisponible: vérification des fichiers toutes les %d s.",
+                POLL_INTERVAL,
+            )
+        self._mtimes = self._stat()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _stat(self):
+        mtimes = {}
+        for name in self.names:
+            try:
+                mtimes[name] = os.stat(os.path.join(self.directory, name)).st_mtime_ns
+            except FileNotFoundError:
+                mtimes[name] = None
+        return mtimes
+
+    def _read_events(self):
+        """Names of the watched files in the pending inotify events."""
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+                offset += length
+                if name in self.names:
+                    changed.add(name)
+
+    def _poll(self):
+        mtimes = self._stat()
+        changed = {name for name in self.names if mtimes[name] != self._mtimes[name]}
+        self._mtimes = mtimes
+        return changed
+
+    def wait(self, timeout):
+        """
+        Block until watched files change or `timeout` seconds pass. A burst
+        of changes is reported once, after `debounce` quiet seconds. Return
+        the names of the changed files (empty on timeout).
+        """
+        deadline = time.monotonic() + max(0.0, timeout)
+        changed = set()
+        while True:
+            # Events of other files (temporary files, state.db...) neither
+            # end nor extend the quiet time of a burst.
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return changed
+            if self._fd is not None:
+                ready, _, _ = select.select([self._fd], [], [], remaining)
+                news = self._read_events() if ready else set()
+            else:
+                time.sleep(min(remaining, POLL_INTERVAL))
+                news = self._poll()
+            if news:
+                changed |= news
+                deadline = time.monotonic() + self.debounce
+
+    def drain(self):
+        """Forget the changes made so far, e.g. the ones written by the caller."""
+        if self._fd is not None:
+            self._read_events()
+        self._mtimes = self._stat()
@@ -0,0 +1,221 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import socket
+import sys
+import time
+
+from pathlib import Path
+
+import requests
+
+from run_trace import tracer
+
+logger = logging.getLogger("module_freeboxos")
+
+APP_ID = "fr.mediaselect.freeboxos"
+APP_NAME = "select-freeboxos"
+APP_VERSION = "3.1.0"
+DEFAULT_BOUQUET = "freeboxtv"
+CONFIG_PATH = Path.home() / ".config" / "select_freeboxos" / "config.json"
+
+
+class FreeboxAPIError(Exception):
+    """Error returned by the Freebox OS API (success = false)."""
+
+    def __init__(self, error_code, msg=""):
+        super().__init__(f"{error_code}: {msg}" if msg else error_code)
+        self.error_code = error_code
+        self.msg = msg
+
+
+class FreeboxAPIClient:
+    """
+    Minimal client for the Freebox OS JSON API.
+
+    Only the calls needed to schedule recordings are implemented:
+    app authorization, session opening, channel list and programmed
+    recordings of the PVR.
+    """
+
+    def __init__(self, base_url, app_token=None, timeout=10, verify=True):
+        self.base_url = base_url.rstrip("/")
+        self.app_token = app_token
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.verify = verify
+        self.session.headers["Accept"] = "application/json"
+        self._api_root = None
+
+    def api_root(self):
+        """Return the versioned API root, e.g. http://host/api/v8/"""
+        if self._api_root is None:
+            response = self.session.get(
+                self.base_url + "/api_version", timeout=self.timeout
+            )
+            response.raise_for_status()
+            info = response.json()
+            major = str(info.get("api_version", "8.0")).split(".")[0]
+            api_base_url = info.get("api_base_url", "/api/")
+            self._api_root = f"{self.base_url}{api_base_url}v{major}/"
+        return self._api_root
+
+    def _call(self, method, path, payload=None):
+        with tracer.remote():
+            response = self.session.request(
+                method,
+                self.api_root() + path,
+                json=payload,
+                timeout=self.timeout,
+            )
+        try:
+            body = response.json()
+        except ValueError:
+            response.raise_for_status()
+            raise FreeboxAPIError("invalid_response", "réponse non JSON")
+        if not body.get("success", False):
+            raise FreeboxAPIError(body.get("error_code", "unknown"), body.get("msg", ""))
+        return body.get("result")
+
+    def authorize(self, device_name=None, poll_interval=1, max_wait=120):
+        """
+        Request a new app token. The user must accept the request on the
+        Freebox Server display. Return the granted app token.
+        """
+        result = self._call("POST", "login/authorize/", {
+            "app_id": APP_ID,
+            "app_name": APP_NAME,
+            "app_version": APP_VERSION,
+            "device_name": device_name or socket.gethostname(),
+        })
+        app_token = result["app_token"]
+        track_id = result["track_id"]
+
+        deadline = time.monotonic() + max_wait
+        while time.monotonic() < deadline:
+            status = self._call("GET", f"login/authorize/{track_id}")["status"]
+            if status == "granted":
+                self.app_token = app_token
+                return app_token
+            if status != "pending":
+                raise FreeboxAPIError("authorization_" + status)
+            time.sleep(poll_interval)
+        raise FreeboxAPIError("authorization_timeout")
+
+    def open_session(self):
+        """Answer the login challenge with the app token and open a session."""
+        if not self.app_token:
+            raise FreeboxAPIError("missing_app_token", "aucun app_token configuré")
+        challenge = self._call("GET", "login/")["challenge"]
+        password = hmac.new(
+            self.app_token.encode(), challenge.encode(), hashlib.sha1
+        ).hexdigest()
+        result = self._call("POST", "login/session/", {
+            "app_id": APP_ID,
+            "password": password,
+        })
+        if not result.get("permissions", {}).get("pvr", False):
+            raise FreeboxAPIError(
+                "insufficient_rights",
+                "l'application n'a pas le droit de programmer des enregistrements",
+            )
+        self.session.headers["X-Fbx-App-Auth"] = result["session_token"]
+
+    def channels(self, bouquet=DEFAULT_BOUQUET):
+        """Return the channel list (number, sub_number, uuid, name) of a bouquet."""
+        return self._call("GET", f"tv/bouquets/{bouquet}/channels/") or []
+
+    def channel_uuids(self, bouquet=DEFAULT_BOUQUET):
+        """Return a mapping channel number -> channel uuid."""
+        return channel_uuids_from_bouquet(self.channels(bouquet))
+
+    def list_programmed(self):
+        """Return the recordings already programmed on the Freebox."""
+        return self._call("GET", "pvr/programmed/") or []
+
+    def program_recording(self, channel_uuid, start, end, name=None):
+        """Program a recording between two aware datetimes."""
+        payload = {
+            "channel_uuid": channel_uuid,
+            "start": int(start.timestamp()),
+            "end": int(end.timestamp()),
+            "margin_before": 0,
+            "margin_after": 0,
+        }
+        if name:
+            payload["name"] = name
+        return self._call("POST", "pvr/programmed/", payload)
+
+    def update_recording(self, recording_id, **fields):
+        """Change fields (e.g. name) of a programmed recording."""
+        return self._call("PUT", f"pvr/programmed/{recording_id}", fields)
+
+
+def channel_uuids_from_bouquet(channels):
+    """Map channel number -> uuid from a tv/bouquets/<id>/channels/ result."""
+    uuids = {}
+    for channel in channels or []:
+        if channel.get("sub_number"):
+            continue
+        uuids.setdefault(str(channel["number"]), channel["uuid"])
+    return uuids
+
+
+def save_app_token(app_token, crypted_credentials):
+    """Store the app token in the keyring or in config.json."""
+    if crypted_credentials:
+        import keyring
+        keyring.set_password("freeboxos", "app_token", app_token)
+        return
+
+    with CONFIG_PATH.open(encoding='utf-8') as f:
+        config = json.load(f)
+    config["FREEBOX_APP_TOKEN"] = app_token
+    tmp_path = CONFIG_PATH.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding='utf-8') as f:
+        json.dump(config, f, indent=4)
+    os.chmod(tmp_path, 0o600)
+    tmp_path.replace(CONFIG_PATH)
+
+
+def authorize_from_config():
+    """Interactive authorization using the address stored in config.json."""
+    with CONFIG_PATH.open(encoding='utf-8') as f:
+        config = json.load(f)
+
+    crypted = bool(config.get("CRYPTED_CREDENTIALS", False))
+    server = config["FREEBOX_SERVER_IP"]
+    if crypted:
+        import keyring
+        server = keyring.get_password("freeboxos", "username")
+    protocol = "https://" if config.get("HTTPS") else "http://"
+
+    client = FreeboxAPIClient(protocol + server)
+    print(
+        "\nUne demande d'autorisation va être envoyée à la Freebox Server.\n"
+        "Veuillez la valider sur l'écran de la Freebox Server "
+        "(flèche de droite puis OK).\n"
+    )
+    try:
+        app_token = client.authorize()
+    except (FreeboxAPIError, requests.RequestException) as e:
+        print(f"L'autorisation a échoué: {e}")
+        return 1
+
+    save_app_token(app_token, crypted)
+    print(
+        "\nL'application est autorisée. Pensez à vérifier dans Freebox OS "
+        "(Paramètres de la Freebox > Gestion des accès > Applications) que "
+        "le droit 'Accès au PVR' est bien coché, puis ajoutez "
+        "\"RECORDING_BACKEND\": \"api\" dans config.json.\n"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "authorize":
+        sys.exit(authorize_from_config())
+    print("Usage: python3 freebox_api.py authorize")
+    sys.exit(2)
@@ -0,0 +1,200 @@
+"""
+Reachability probe of Freebox OS, run before each run and by install.py.
+
+The probe is one small request on a pooled session, with connect and read
+timeouts: only the first few KB of the landing page are read, to find its
+<title>. The host name is resolved once and the address is kept for a
+short time, so that the security policy (freeboxos.is_private_address())
+checks the address which was actually probed. Answered probes are cached
+for CACHE_TTL seconds; failed ones are tried again at the next call.
+
+    result = probe("http://192.168.1.254")
+    result.title == "Freebox OS"
+
+discover() probes several candidate addresses at once, with shorter
+timeouts, and ranks the answers (install.py).
+"""
+import html
+import ipaddress
+import logging
+import re
+import socket
+import subprocess
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger("module_freeboxos")
+
+TIMEOUT = (3, 5)  # connect, read (seconds)
+MAX_DURATION = 10  # seconds, for the whole probe
+MAX_BYTES = 8 * 1024
+CACHE_TTL = 60  # seconds
+DISCOVERY_TIMEOUT = (1.5, 3)  # connect, read (seconds)
+
+FREEBOX_OS_TITLE = "Freebox OS"
+LOCAL_HOSTNAME = "mafreebox.freebox.fr"
+
+TITLE_RE = re.compile(rb"<title[^>]*>(.*?)</title", re.IGNORECASE | re.DOTALL)
+
+_session = None
+_lock = threading.Lock()
+_addresses = {}  # host name -> (expiry, address)
+_results = {}  # url -> (expiry, ProbeResult)
+
+
+class ProbeResult(NamedTuple):
+    url: str
+    address: str  # None when the host name does not resolve
+    title: str  # None when the page could not be read or has no title
+    error: str = None
+
+
+def get_session():
+    """Return the pooled HTTP session of the probes."""
+    global _session
+    with _lock:
+        if _session is None:
+            import requests
+            _session = requests.Session()
+            _session.headers.update({"Accept": "text/html"})
+        return _session
+
+
+def resolve(hostname):
+    """
+    Return the IP address of `hostname` (a host name or an address, with an
+    optional port), or None. An address is kept for CACHE_TTL seconds.
+    """
+    host = urlsplit("//" + hostname).hostname
+    if host is None:
+        return None
+    now = time.monotonic()
+    with _lock:
+        cached = _addresses.get(host)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    try:
+        address = str(ipaddress.ip_address(host))
+    except ValueError:
+        try:
+            infos = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+            address = infos[0][4][0]
+        except (OSError, IndexError):
+            return None
+    with _lock:
+        _addresses[host] = (now + CACHE_TTL, address)
+    return address
+
+
+def _read_title(response):
+    """Read the page up to MAX_BYTES, until its <title> is found."""
+    head = b""
+    deadline = time.monotonic() + MAX_DURATION
+    for chunk in response.iter_content(chunk_size=1024):
+        head += chunk
+        match = TITLE_RE.search(head)
+        if match:
+            encoding = response.encoding or "utf-8"
+            return html.unescape(match.group(1).decode(encoding, errors="replace")).strip()
+        if len(head) >= MAX_BYTES or time.monotonic() > deadline:
+            break
+    return None
+
+
+def probe(url, timeout=TIMEOUT):
+    """
+    Fetch the title of the page `url`. Return a ProbeResult, cached for
+    CACHE_TTL seconds when the page answered. Errors are reported in the
+    result, not raised.
+    """
+    now = time.monotonic()
+    with _lock:
+        cached = _results.get(url)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    import requests
+
+    parts = urlsplit(url)
+    address = resolve(parts.netloc)
+    if address is None:
+        result = ProbeResult(url, None, None, "unknown host")
+    else:
+        target, headers = url, {}
+        if parts.scheme == "http":
+            # Connect to the resolved address, the one the security policy checks.
+            host = f"[{address}]" if ":" in address else address
+            if parts.port:
+                host += f":{parts.port}"
+            target = parts._replace(netloc=host).geturl()
+            headers["Host"] = parts.netloc
+        try:
+            with get_session().get(
+                target, headers=headers, timeout=timeout, stream=True
+            ) as response:
+                response.raise_for_status()
+                result = ProbeResult(url, address, _read_title(response))
+        except requests.RequestException as e:
+            logger.error(f"An error occurred: {e}")
+            result = ProbeResult(url, address, None, type(e).__name__)
+
+    if result.error is None:
+        with _lock:
+            _results[url] = (time.monotonic() + CACHE_TTL, result)
+    return result
+
+
+def default_gateway():
+    """Address of the default route (ip route show default), or None."""
+    try:
+        output = subprocess.run(
+            ["ip", "route", "show", "default"],
+            capture_output=True, text=True, timeout=5,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    fields = output.split()
+    if len(fields) > 2 and fields[:2] == ["default", "via"]:
+        return fields[2]
+    return None
+
+
+def local_candidates(*addresses):
+    """
+    URLs where Freebox OS may answer on the local network: `addresses`
+    (typed by the user), the default gateway and mafreebox.freebox.fr.
+    """
+    hosts = [*addresses, default_gateway(), LOCAL_HOSTNAME]
+    return list(dict.fromkeys(f"http://{host}" for host in hosts if host))
+
+
+def rank(result):
+    """
+    Sort key of the discovery results: Freebox OS first, then private
+    addresses, then HTTPS. Results ranked equal keep the order of the
+    candidates.
+    """
+    private = result.address is not None and ipaddress.ip_address(result.address).is_private
+    return (
+        result.error is not None,
+        result.title != FREEBOX_OS_TITLE,
+        not private,
+        urlsplit(result.url).scheme != "https",
+    )
+
+
+def discover(urls, timeout=DISCOVERY_TIMEOUT):
+    """
+    Probe the candidate `urls` concurrently. Return their ProbeResult,
+    sorted by rank(): the first one is Freebox OS when any answered.
+    """
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return []
+    with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        results = list(executor.map(lambda url: probe(url, timeout), urls))
+    return sorted(results, key=rank)
@@ -1,217 +1,216 @@
+import argparse
+import atexit
 import ipaddress
+import itertools
 import json
-import keyring
 import logging
-import os
-import sentry_sdk
-import shutil
-import socket
+import queue
+import signal
 import sys
-import tempfile
-import re
+import threading
 
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
 from zoneinfo import ZoneInfo
-from time import sleep
-from logging.handlers import RotatingFileHandler
-from selenium import webdriver
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.firefox.service import Service
-from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException, WebDriverException, ElementNotInteractableException, SessionNotCreatedException
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-
-from sentry_sdk.integrations.logging import LoggingIntegration
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
+from channel_index import load_channel_index
 from channels_free import CHANNELS_FREE
-from module_freeboxos import get_website_title, is_snap_installed, is_firefox_snap
-from security_sanitizer import global_sanitizer, scrub_event
-
-BASE_DIR = Path.home() / ".local" / "share" / "select_freeboxos"
-LOG_FILE = BASE_DIR / "logs" / "select_freeboxos.log"
-INFO_PROGS_FILE = BASE_DIR / "info_progs.json"
-INFO_PROGS_LAST_FILE = BASE_DIR / "info_progs_last.json"
-GECKODRIVER_PATH = BASE_DIR / "geckodriver"
-LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
-
-max_bytes = 10 * 1024 * 1024  # 10 MB
-backup_count = 5
-log_handler = RotatingFileHandler(str(LOG_FILE), maxBytes=max_bytes, backupCount=backup_count)
-log_format = '%(asctime)s %(levelname)s %(message)s'
-log_datefmt = '%d-%m-%Y %H:%M:%S'
-formatter = logging.Formatter(log_format, log_datefmt)
-log_handler.setFormatter(formatter)
+from config_freeboxos import (
+    BASE_DIR,
+    INFO_PROGS_FILE,
+    LOG_FILE,
+    PROGS_TO_RECORD_FILE,
+    PROGS_TO_UPDATE_FILE,
+    ConfigError,
+    get_validated_user,
+    load_keyring_credentials,
+    load_settings,
+    validate_path_safety,
+)
+from freebox_probe import probe, resolve
+from module_freeboxos import build_url
+from planner import plan_recordings
+from programme import FAILED, PROGRAMMED, SKIPPED
+from progs_stream import iter_programmes
+from reconcile import build_programmed_index
+from run_journal import JournaledOutcomes, RunJournal
+from run_trace import tracer
+from security_sanitizer import SentryScrubber, global_sanitizer
+from state_store import ABORTED, DONE, StateStore
+
 logger = logging.getLogger("module_freeboxos")
-logger.addHandler(log_handler)
-sentry_handler = logging.StreamHandler()
-sentry_handler.setLevel(logging.WARNING)
-logger.addHandler(sentry_handler)
-logger.setLevel(logging.INFO)
-
-def get_validated_user():
-    """Securely get and validate the USER environment variable."""
-    user = os.getenv("USER")
-    if not user:
-        raise ValueError("USER environment variable is not set")
-    if not re.match(r'^[a-zA-Z0-9_-]+$', user):
-        raise ValueError(f"Invalid USER environment variable: contains unsafe characters")
-    home_path = Path.home()
-    expected_home = Path(f"/home/{user}")
-    if home_path != expected_home:
-        user = home_path.name
-        if not re.match(r'^[a-zA-Z0-9_-]+$', user):
-            raise ValueError("Home directory name contains unsafe characters")
-    return user
-
-try:
-    user = get_validated_user()
-except ValueError as e:
-    logger.error(f"SECURITY ERROR: {e}", exc_info=False)
-    sys.exit(1)
-
-def validate_path_safety(path, base_dir):
-    """Ensure path doesn't escape base directory via traversal attacks."""
-    try:
-        resolved_path = path.resolve()
-        resolved_base = base_dir.resolve()
-        resolved_path.relative_to(resolved_base)
-        return resolved_path
-    except (ValueError, RuntimeError):
-        raise ValueError(f"Path {path} attempts to escape base directory {base_dir}")
-
-try:
-    validate_path_safety(BASE_DIR, Path.home())
-    validate_path_safety(LOG_FILE, BASE_DIR)
-except ValueError as e:
-    logger.error(f"SECURITY ERROR: {e}", exc_info=False)
-    sys.exit(1)
-
-CONFIG_PATH = Path.home() / ".config" / "select_freeboxos" / "config.json"
-try:
-    with CONFIG_PATH.open(encoding='utf-8') as f:
-        config = json.load(f)
-except FileNotFoundError:
-    logger.error("ERROR: config.json not found")
-    sys.exit(1)
-except json.JSONDecodeError as e:
-    logger.error(f"ERROR: invalid config.json: {e}", exc_info=False)
-    sys.exit(1)
-
-try:
-    ADMIN_PASSWORD = config["ADMIN_PASSWORD"]
-    FREEBOX_SERVER_IP = config["FREEBOX_SERVER_IP"]
-    MEDIA_SELECT_TITLES = bool(config["MEDIA_SELECT_TITLES"])
-    MAX_SIM_RECORDINGS = int(config["MAX_SIM_RECORDINGS"])
-    HTTPS = bool(config["HTTPS"])
-    SENTRY_MONITORING_SDK = bool(config["SENTRY_MONITORING_SDK"])
-    CRYPTED_CREDENTIALS = bool(config.get("CRYPTED_CREDENTIALS", False))
-    SECURITY_STRICT_MODE = bool(config.get("SECURITY_STRICT_MODE", True))
-except KeyError as e:
-    logger.error(f"ERROR: missing config key: {e}", exc_info=False)
-    sys.exit(1)
+
+PROFILE_FILE = BASE_DIR / "freeboxos.prof"
+LOG_QUEUE_SIZE = 10000  # records
+
+# Set to stop the run after the current programme: on a Freebox internal
+# error or on SIGTERM. The run is then resumed by the next one.
+RUN_STOP = threading.Event()
 
 sensitive_filter = global_sanitizer
-sensitive_filter.update_patterns({
-    "admin_password": ADMIN_PASSWORD,
-    "freebox_ip": FREEBOX_SERVER_IP,
-})
-log_handler.addFilter(sensitive_filter)
-sentry_handler.addFilter(sensitive_filter)
-
-month_names_fr = {
-    '01': 'Jan',
-    '02': 'Fév',
-    '03': 'Mar',
-    '04': 'Avr',
-    '05': 'Mai',
-    '06': 'Juin',
-    '07': 'Juil',
-    '08': 'Août',
-    '09': 'Sept',
-    '10': 'Oct',
-    '11': 'Nov',
-    '12': 'Déc'
-}
-
-def translate_month(month_num):
-    if month_num in month_names_fr:
-        return month_names_fr[month_num]
-    else:
-        return "Mois invalide"
-
-def cancel_record(driver):
-    text_to_click = "Annuler"
-    xpath = f"//span[text()='{text_to_click}']"
-    cancel = driver.find_element(By.XPATH, xpath)
-    cancel.click()
-    sleep(5)
-
-def find_element_with_retries(driver, by, value, retries=3, delay=1):
-    """Try to find an element with retries."""
-    for attempt in range(retries):
-        try:
-            return driver.find_element(by, value)
-        except NoSuchElementException:
-            logger.error(
-                f"Attempt {attempt + 1}/{retries}: Le bouton programmer un enregistrement n'a pas été trouvé."
-            )
-            sleep(delay)
-    logger.error(
-        "Impossible de trouver le bouton programmer un enregistrement après plusieurs tentatives."
-    )
-    driver.quit()
-    exit()
-
-def validate_video_title(title):
-    """Validate video title"""
-    # Allow most characters but remove potentially dangerous ones
-    sanitized_title = re.sub(r'[<>\'"]', '', title)
-    if len(sanitized_title) > 200:
-        sanitized_title = sanitized_title[:200]
-
-    return sanitized_title
-
-def atomic_file_copy(src, dst):
-    """Perform atomic file copy to prevent corruption."""
-    src_path = Path(src)
-    dst_path = Path(dst)
-
-    validate_path_safety(src_path, BASE_DIR)
-    validate_path_safety(dst_path, BASE_DIR)
-
-    with tempfile.NamedTemporaryFile(
-        mode='w',
-        dir=dst_path.parent,
-        delete=False,
-        prefix='.tmp_',
-        suffix=dst_path.suffix
-    ) as tmp_file:
-        tmp_path = Path(tmp_file.name)
 
+def setup_logging(stream=True):
+    """
+    Attach the rotating log file handler and, unless stream is False, a
+    stderr handler for warnings (once per process).
+    """
+    if logger.handlers:
+        return
+    LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+
+    # The logger filter scrubs each record once, before any handler (and the
+    # Sentry logging integration) sees it. The handler filters only act on
+    # records of child loggers, the others are already marked as scrubbed.
+    logger.addFilter(sensitive_filter)
+
+    max_bytes = 10 * 1024 * 1024  # 10 MB
+    backup_count = 5
+    log_handler = RotatingFileHandler(str(LOG_FILE), maxBytes=max_bytes, backupCount=backup_count)
+    log_format = '%(asctime)s %(levelname)s %(message)s'
+    log_datefmt = '%d-%m-%Y %H:%M:%S'
+    formatter = logging.Formatter(log_format, log_datefmt)
+    log_handler.setFormatter(formatter)
+    logger.addHandler(log_handler)
+    log_handler.addFilter(sensitive_filter)
+    if stream:
+        sentry_handler = logging.StreamHandler()
+        sentry_handler.setLevel(logging.WARNING)
+        sentry_handler.addFilter(sensitive_filter)
+        logger.addHandler(sentry_handler)
+    logger.setLevel(logging.INFO)
+
+class LogQueueHandler(QueueHandler):
+    """
+    Put the records on the queue as they are: the formatting (traceback
+    included) is left to the handlers of the writer thread. The records are
+    already scrubbed by the logger filter. Only the message is merged, so
+    that a later change of a mutable argument does not show up in the log.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        # Block rather than drop records when the writer is far behind.
+        self.queue.put(record)
+
+_log_listener = None
+
+def enable_queued_logging(queue_size=LOG_QUEUE_SIZE):
+    """
+    Move the handlers of setup_logging() behind a bounded queue: the caller
+    scrubs and enqueues its records, and a QueueListener thread formats,
+    writes and rotates them. The queue is flushed by stop_queued_logging(),
+    registered with atexit so that it also runs on sys.exit() and on an
+    uncaught exception.
+    """
+    global _log_listener
+    if _log_listener is not None or not logger.handlers:
+        return
+    handlers = list(logger.handlers)
+    for handler in handlers:
+        logger.removeHandler(handler)
+    # The logger filter stays: the records must be scrubbed in the caller
+    # thread, where the Sentry logging integration reads them.
+
+    log_queue = queue.Queue(queue_size)
+    logger.addHandler(LogQueueHandler(log_queue))
+    _log_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(stop_queued_logging)
+
+def stop_queued_logging():
+    """Write the queued records and give the handlers back to the logger."""
+    global _log_listener
+    if _log_listener is None:
+        return
+    listener, _log_listener = _log_listener, None
+    for handler in list(logger.handlers):
+        if isinstance(handler, LogQueueHandler):
+            logger.removeHandler(handler)
+    listener.stop()
+    for handler in listener.handlers:
+        logger.addHandler(handler)
+
+def init_sentry(settings):
+    if settings.sentry_monitoring_sdk:
+        import sentry_sdk
+        sentry_sdk.init(
+            dsn="https://730d02f037b381f4c37d1c8c26517838@o4508778574381056.ingest.de.sentry.io/4508841984131152",
+            traces_sample_rate=0,
+            send_default_pii=False,
+            include_local_variables=False,
+            before_send=SentryScrubber(global_sanitizer),
+        )
+        if sentry_sdk.Hub.current.client and sentry_sdk.Hub.current.client.options.get("traces_sample_rate", 0) > 0:
+            sentry_sdk.profiler.start_profiler()
+
+def prepare_settings():
+    """
+    Validate the environment and load config.json. Exit the programme when
+    they are unusable. Secrets, Sentry and Selenium are left to
+    prepare_session(), once there is something to record.
+    """
     try:
-        shutil.copy2(src_path, tmp_path)
+        get_validated_user()
+        validate_path_safety(BASE_DIR, Path.home())
+        validate_path_safety(LOG_FILE, BASE_DIR)
+    except ValueError as e:
+        logger.error(f"SECURITY ERROR: {e}", exc_info=False)
+        sys.exit(1)
 
-        if not tmp_path.exists():
-            raise IOError("Temporary file was not created")
+    try:
+        settings = load_settings()
+    except ConfigError as e:
+        logger.error(str(e), exc_info=False)
+        sys.exit(1)
 
-        tmp_path.replace(dst_path)
-    except Exception as e:
-        # Clean up temporary file on error
-        if tmp_path.exists():
-            tmp_path.unlink()
-        raise e
+    sensitive_filter.update_patterns(settings.secrets())
+    if settings.queued_logging:
+        enable_queued_logging()
+    return settings
+
+_session_settings = None
+
+def prepare_session(settings):
+    """
+    Load what a recording session needs: the crypted credentials, Sentry
+    and, for the Selenium backend, the wait timeouts. Done once per
+    settings object; return False when the credentials are unusable.
+    """
+    global _session_settings
+    if _session_settings is settings:
+        return True
+
+    if settings.crypted_credentials:
+        try:
+            load_keyring_credentials(settings)
+        except ConfigError as e:
+            logger.error(str(e))
+            return False
+        sensitive_filter.update_patterns(settings.secrets())
+
+    init_sentry(settings)
+
+    if settings.recording_backend == "selenium":
+        from waits import configure_waits
+        configure_waits(settings.wait_timeouts)
+
+    _session_settings = settings
+    return True
 
 def is_private_address(hostname: str) -> bool:
     """
     Determine whether a hostname resolves to a private IP address.
     """
-    try:
-        ip = socket.gethostbyname(hostname)
-        return ipaddress.ip_address(ip).is_private
-    except Exception:
+    address = resolve(hostname)
+    if address is None:
         return False
+    return ipaddress.ip_address(address).is_private
 
 def classify_connection_context(hostname: str, https_enabled: bool) -> str:
     """
@@ -227,7 +226,8 @@ def classify_connection_context(hostname: str, https_enabled: bool) -> str:
 
     return "remote_insecure"
 
-def enforce_security_policy(hostname: str, https_enabled: bool):
+def enforce_security_policy(hostname: str, https_enabled: bool, strict_mode: bool = True) -> bool:
+    """Return False when the connection must not be used."""
     context = classify_connection_context(hostname, https_enabled)
 
     if context == "remote_insecure":
@@ -236,9 +236,9 @@ def enforce_security_policy(hostname: str, https_enabled: bool):
             "Pour des raisons de sécurité, HTTPS est obligatoire "
             "lorsque l’ordinateur peut se trouver sur un réseau public."
         )
-        sys.exit(1)
+        return False
 
-    if SECURITY_STRICT_MODE and context == "remote_secure":
+    if strict_mode and context == "remote_secure":
         logger.warning(
             "Connexion distante détectée. "
             "Le mode sécurité stricte est activé : "
@@ -246,394 +246,514 @@ def enforce_security_policy(hostname: str, https_enabled: bool):
         )
 
     logger.info("Contexte réseau détecté : %s", context)
+    return True
 
-def build_url(use_https, server_ip, path=""):
+def load_starting():
     """
-    Safely construct URL.
+    Return the (start, end) of the programmes of the last successful run
+    which are not over yet.
     """
-    protocol = "https://" if use_https else "http://"
-    full_url = protocol + server_ip + path
-    return full_url
+    with StateStore() as store:
+        return store.intervals(datetime.now(ZoneInfo("Europe/Paris")))
 
-if SENTRY_MONITORING_SDK:
-    sentry_sdk.init(
-        dsn="https://730d02f037b381f4c37d1c8c26517838@o4508778574381056.ingest.de.sentry.io/4508841984131152",
-        traces_sample_rate=0,
-        send_default_pii=False,
-        include_local_variables=False,
-        before_send=scrub_event,
-    )
-    if sentry_sdk.Hub.current.client and sentry_sdk.Hub.current.client.options.get("traces_sample_rate", 0) > 0:
-        sentry_sdk.profiler.start_profiler()
+def resolve_channel_number(name, channel_index=None):
+    """
+    Return the Freebox channel number of a media-select channel name, with
+    the channel list of the Freebox when available, or None (reported).
+    """
+    if channel_index is not None:
+        if channel_index.check({name}):
+            return None
+        return str(channel_index.resolve(name)["number"])
 
-if CRYPTED_CREDENTIALS:
-    try:
-        FREEBOX_SERVER_IP = keyring.get_password("freeboxos", "username")
-        ADMIN_PASSWORD = keyring.get_password("freeboxos", "password")
-        if FREEBOX_SERVER_IP is None:
-            logger.error("Failed to retrieve 'username' from keyring for 'freeboxos'.")
-            exit(1)
-        if ADMIN_PASSWORD is None:
-            logger.error("Failed to retrieve 'password' from keyring for 'freeboxos'.")
-            exit(1)
-        sensitive_filter.update_patterns({
-            "admin_password": ADMIN_PASSWORD,
-            "freebox_ip": FREEBOX_SERVER_IP,
-        })
-    except Exception as e:
-        logger.exception("An error occurred while retrieving credentials from keyring.")
-        exit(1)
+    number = CHANNELS_FREE.get(name)
+    if number is None:
+        logger.error(
+            "La chaine " + name + " n'est pas "
+            "présente dans le fichier channels_free.py"
+        )
+    return number
 
-if HTTPS is False:
-    url = "http://" + FREEBOX_SERVER_IP
-    title = get_website_title(url)
+def programmes_to_record(programmes, starting, max_sim_recordings, programmed_index=None,
+                         channel_index=None):
+    """
+    Return (video, start, end, channel_number) for each programme which can
+    be recorded without exceeding max_sim_recordings, sorted by start.
+    `starting` holds the (start, end) of recordings already programmed.
+    Programmes found in `programmed_index` are already on the Freebox.
+    `programmes` (programme.Programme objects) is read once, so it can be
+    a generator.
+    """
+    candidates = []
+    channel_numbers = {}  # name -> number, resolved (and reported) once
+
+    for video in programmes:
+        name = video.channel
+        if name not in channel_numbers:
+            channel_numbers[name] = resolve_channel_number(name, channel_index)
+        channel_number = channel_numbers[name]
+        if channel_number is None:
+            continue
+
+        start = video.start
+        end = video.end
+        if programmed_index is not None and programmed_index.contains(channel_number, start, end):
+            logger.info("Le programme %s est déjà programmé sur la Freebox.", video.title)
+            continue
+        candidates.append((start, end, (video, channel_number)))
+
+    return [
+        (video, start, end, channel_number)
+        for start, end, (video, channel_number)
+        in plan_recordings(starting, candidates, max_sim_recordings)
+    ]
+
+def skip_journaled(data, journal):
+    """Leave out the programmes already programmed by an interrupted run."""
+    for video in data:
+        if journal.is_programmed(video):
+            logger.info(
+                "Le programme %s a déjà été programmé par l'exécution interrompue.",
+                video.title
+            )
+            continue
+        yield video
 
-    if title != "Freebox OS":
-        logger.error(
-            "Imposible to connect to the Freebox server. Exit programme."
+def select_programmes(settings, data, programmed_index=None, channel_index=None, journal=None):
+    """
+    Plan the recordings of `data`. The recordings read on the Freebox are
+    authoritative; the programmes of the last run (and the ones of the
+    interrupted run of `journal`) are only used when they could not be read.
+    """
+    if journal is not None:
+        data = skip_journaled(data, journal)
+    if programmed_index is None:
+        logger.warning(
+            "Impossible de lire les enregistrements programmés sur la Freebox: "
+            "utilisation des programmes de la dernière exécution."
         )
-        exit()
-
-try:
-    with open(
-        f"/home/{user}/.local/share/select_freeboxos/info_progs.json", "r", encoding='utf-8'
-    ) as jsonfile:
-        data_info_progs = json.load(jsonfile)
-except FileNotFoundError:
-    logger.error(
-        "No info_progs.json file. Need to check curl command or "
-        "internet connection. Exit programme."
-    )
-    exit()
-except json.JSONDecodeError:
-    logger.error(
-        "Invalid JSON data in info_progs.json file. The file may be empty or corrupted."
-    )
-    exit()
-
-try:
-    with open(
-        f"/home/{user}/.local/share/select_freeboxos/"
-        "progs_to_record.json", "r", encoding='utf-8'
-    ) as jsonfile:
-        data = json.load(jsonfile)
-except FileNotFoundError:
-    logger.error(
-        "No progs_to_record.json file. Exit programme."
+        starting = load_starting()
+        if journal is not None:
+            starting += journal.intervals()
+    else:
+        starting = programmed_index.intervals
+    return programmes_to_record(
+        data, starting, settings.max_sim_recordings, programmed_index, channel_index
     )
-    exit()
 
-if len(data) == 0 or len(data_info_progs) == 0:
-    atomic_file_copy(INFO_PROGS_FILE, INFO_PROGS_LAST_FILE)
-    logger.info("No data to record programmes. Exit programme.")
-    exit()
+def rename_modified_programmes(client, programmed_index, channel_index=None):
+    """
+    Give the corrected media-select title to the programmes of
+    progs_to_update.json which are already programmed on the Freebox. The
+    channels are resolved as for the planning, see resolve_channel_number().
+    """
+    import requests
+    from freebox_api import FreeboxAPIError
 
-if is_snap_installed() and is_firefox_snap():
-    service = Service(executable_path="/snap/bin/firefox.geckodriver")
-else:
-    service = Service(executable_path=f"/home/{user}/.local/share/select_freeboxos/geckodriver")
+    now = datetime.now(ZoneInfo("Europe/Paris"))
+    try:
+        modified = list(iter_programmes(PROGS_TO_UPDATE_FILE, not_before=now))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return
+
+    channel_numbers = {}  # name -> number, resolved (and reported) once
+    for video in modified:
+        name = video.channel
+        if name not in channel_numbers:
+            channel_numbers[name] = resolve_channel_number(name, channel_index)
+        channel_number = channel_numbers[name]
+        if channel_number is None:
+            continue
+        recording = programmed_index.find(channel_number, video.start, video.end)
+        title = video.title
+        if recording is None or recording.get("name") == title:
+            continue
+        try:
+            client.update_recording(recording["id"], name=title)
+        except (FreeboxAPIError, requests.RequestException) as e:
+            logger.error("Le programme %s n'a pas pu être renommé: %s", title, e)
 
-options = webdriver.FirefoxOptions()
-options.add_argument("start-maximized")
-options.add_argument("--headless")
+def has_renames(settings, now):
+    """
+    True when the API run has titles of progs_to_update.json to give to
+    programmed recordings, see rename_modified_programmes().
+    """
+    if settings.recording_backend != "api" or not settings.media_select_titles:
+        return False
+    try:
+        return next(iter_programmes(PROGS_TO_UPDATE_FILE, not_before=now), None) is not None
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
 
-try:
-    with webdriver.Firefox(service=service, options=options) as driver:
-        try:
-            enforce_security_policy(FREEBOX_SERVER_IP, HTTPS)
-            url = build_url(HTTPS, FREEBOX_SERVER_IP, "/login.php#Fbx.os.app.pvr.app")
-            driver.get(url)
-            sleep(8)
-        except WebDriverException as e:
-            if 'net::ERR_ADDRESS_UNREACHABLE' in e.msg:
-                logger.error(
-                    f"The programme cannot reach the address {FREEBOX_SERVER_IP} . Exit programme."
-                )
-                driver.quit()
-                exit()
-            else:
-                logger.error("A WebDriverException occurred. Exiting the program.")
-                logger.error(f"Exception type: {type(e).__name__}")
-                driver.quit()
-                exit()
+def record_with_api(settings, data, outcomes=None, journal=None):
+    """
+    Program the recordings through the Freebox OS JSON API. The
+    (programme, outcome) pairs are appended to `outcomes`; the programmes
+    done according to `journal` (a RunJournal) are skipped.
+    """
+    import requests
+    from freebox_api import FreeboxAPIClient, FreeboxAPIError
 
+    client = FreeboxAPIClient(
+        build_url(settings.https, settings.freebox_server_ip), settings.freebox_app_token
+    )
+    def fetch_channels():
         try:
-            login = driver.find_element("id", "fbx-password")
-        except Exception as e:
-            logger.error(
-                "Cannot connect to Freebox OS. Exit programme.", exc_info=False
-            )
-            driver.quit()
-            exit()
-        sleep(1)
-        login.click()
-        sleep(1)
-        login.send_keys(ADMIN_PASSWORD)
-        ADMIN_PASSWORD = None
-        sleep(1)
-        login.send_keys(Keys.RETURN)
-        sleep(10)
+            return client.channels()
+        except (FreeboxAPIError, requests.RequestException):
+            return None
 
-        try:
-            invalid_password = driver.find_element(
-                By.XPATH, "//div[contains(text(), 'Identifiants invalides')]"
-            )
+    try:
+        with tracer.span("login"):
+            client.open_session()
+    except (FreeboxAPIError, requests.RequestException) as e:
+        logger.error("Impossible d'ouvrir une session sur l'API Freebox OS: %s", e)
+        return False
+
+    with tracer.span("channels"):
+        channel_index = load_channel_index(fetch_channels)
+    if channel_index is None:
+        logger.error("Impossible de lire la liste des chaînes de la Freebox.")
+        return False
+    channel_uuids = channel_index.channel_uuids()
+
+    try:
+        with tracer.span("fetch_programmed"):
+            programmed_index = build_programmed_index(client.list_programmed(), channel_uuids)
+    except (FreeboxAPIError, requests.RequestException):
+        programmed_index = None
+    with tracer.span("plan"):
+        programmes = select_programmes(
+            settings, data, programmed_index, channel_index, journal
+        )
+    if settings.media_select_titles and programmed_index is not None:
+        with tracer.span("rename"):
+            rename_modified_programmes(client, programmed_index, channel_index)
+
+    for programme in programmes:
+        if RUN_STOP.is_set():
+            break
+        with tracer.span("programme"):
+            outcome = program_with_api(settings, client, channel_uuids, *programme)
+        if outcomes is not None:
+            outcomes.append((programme, outcome))
+        if outcome == FAILED:
+            RUN_STOP.set()
+    return True
+
+def program_with_api(settings, client, channel_uuids, video, start, end, channel_number):
+    """Program one recording. Return PROGRAMMED, SKIPPED, or FAILED when the run must stop."""
+    import requests
+    from freebox_api import FreeboxAPIError
+
+    title = video.title
+    channel_uuid = channel_uuids.get(channel_number)
+    if channel_uuid is None:
+        logger.error(
+            "Impossible de sélectionner la chaîne. Merci de "
+            "vérifier si la chaine n°" + channel_number + " qui "
+            "correspond à la chaine " + video.channel + " "
+            "de MEDIA-select est bien présente dans la liste des "
+            "chaines Freebox. "
+        )
+        return SKIPPED
+    try:
+        client.program_recording(
+            channel_uuid, start, end, title if settings.media_select_titles else None
+        )
+    except FreeboxAPIError as e:
+        if e.error_code == "internal_error":
             logger.error(
-                "Le mot de passe administrateur de la Freebox est invalide. "
+                "Une erreur interne de la Freebox est survenue. "
                 "La programmation des enregistrements n'a pas "
-                "pu être réalisée. Merci de vérifier le mot de passe."
+                "pu être réalisée. Merci de vérifier si le disque "
+                "dur n'est pas plein."
             )
-            driver.quit()
-            exit()
-        except NoSuchElementException:
-            pass
+            return FAILED
+        logger.error("Le programme %s n'a pas pu être programmé: %s", title, e)
+        return SKIPPED
+    except requests.RequestException as e:
+        logger.error("Le programme %s n'a pas pu être programmé: %s", title, e)
+        return SKIPPED
+    return PROGRAMMED
+
+def program_with_workers(settings, driver, programmes, channel_index, outcomes=None):
+    """
+    Program the planned `programmes` with up to settings.browser_workers
+    Freebox OS sessions: `driver` and extra logged-in Firefox instances,
+    each one given every K-th programme. The programmes of a session which
+    fails are programmed afterwards with `driver`. The (programme, outcome)
+    pairs of all the sessions are appended to `outcomes`, which is returned.
+    """
+    from freeboxos_browser import (
+        login,
+        open_freebox_os,
+        program_recordings,
+        start_browser,
+    )
 
+    if outcomes is None:
+        outcomes = []
+    workers = min(settings.browser_workers, len(programmes))
+    if workers <= 1:
+        return program_recordings(
+            driver, programmes, settings.media_select_titles, channel_index, outcomes,
+            RUN_STOP,
+        )
 
-        try:
-            with open(
-                f"/home/{user}/.local/share/select_freeboxos/info_progs_last.json", "r", encoding='utf-8'
-            ) as jsonfile:
-                data_last = json.load(jsonfile)
-        except FileNotFoundError:
-            data_last = []
-
-        starting = []
-
-        for video in data_last:
-            start = datetime.strptime(video["start"], "%Y%m%d%H%M").replace(
-                tzinfo=ZoneInfo("Europe/Paris")
-            )
-            end = start + timedelta(seconds=video["duration"])
+    shares = [programmes[number::workers] for number in range(workers)]
 
-            starting.append((start, end))
+    def work(number):
+        with tracer.span("worker"):
+            if number == 0:
+                program_recordings(
+                    driver, shares[0], settings.media_select_titles, channel_index,
+                    outcomes, RUN_STOP,
+                )
+                return
+            with tracer.span("browser_start"):
+                worker_driver = start_browser()
+            with worker_driver:
+                tracer.instrument_driver(worker_driver)
+                with tracer.span("login"):
+                    open_freebox_os(worker_driver, settings.freebox_server_ip, settings.https)
+                    login(worker_driver, settings.admin_password)
+                program_recordings(
+                    worker_driver, shares[number], settings.media_select_titles,
+                    channel_index, outcomes, RUN_STOP,
+                )
 
-        now_date = datetime.now().astimezone(ZoneInfo("Europe/Paris")).date()
+    with ThreadPoolExecutor(workers, thread_name_prefix="freeboxos-worker") as pool:
+        futures = [pool.submit(work, number) for number in range(workers)]
+
+    # All the sessions append to `outcomes`: split it by share.
+    handled = {id(programme): outcome for programme, outcome in outcomes}
+    leftovers = []
+    for number, future in enumerate(futures):
+        error = future.exception()
+        if error is not None:
+            if number == 0:
+                # The main session is unusable: let the caller report it.
+                raise error
+            logger.error("Session Freebox OS n°%d interrompue: %s", number + 1, error)
+            leftovers.extend(p for p in shares[number] if id(p) not in handled)
+        logger.info(
+            "Session Freebox OS n°%d: %d programmé(s) sur %d.",
+            number + 1,
+            sum(handled.get(id(p)) == PROGRAMMED for p in shares[number]),
+            len(shares[number]),
+        )
 
-        n = 0
-        last_channel = "x/x"
-        start_last = None
+    if leftovers:
+        program_recordings(
+            driver, leftovers, settings.media_select_titles, channel_index, outcomes,
+            RUN_STOP,
+        )
+    return outcomes
 
-        for video in data:
-            n += 1
+def record_with_browser(settings, data, driver=None, outcomes=None, journal=None):
+    """
+    Program the recordings through the Freebox OS web interface. `driver`
+    is an already logged-in browser; when None, Firefox is started and
+    closed for this run. The (programme, outcome) pairs are appended to
+    `outcomes`; the programmes done according to `journal` (a RunJournal)
+    are skipped.
+    """
+    from freeboxos_browser import (
+        FreeboxOSError,
+        fetch_channels,
+        fetch_programmed_index,
+        login,
+        open_freebox_os,
+        start_browser,
+    )
 
-            start = datetime.strptime(video["start"], "%Y%m%d%H%M").replace(
-                tzinfo=ZoneInfo("Europe/Paris")
+    def program(driver):
+        tracer.instrument_driver(driver)
+        with tracer.span("channels"):
+            channel_index = load_channel_index(lambda: fetch_channels(driver))
+        with tracer.span("fetch_programmed"):
+            programmed_index = fetch_programmed_index(driver, channel_index)
+        with tracer.span("plan"):
+            programmes = select_programmes(
+                settings, data, programmed_index, channel_index, journal
             )
-            if start_last is not None and start == start_last:
-                start += timedelta(minutes=1)
-
-            start_last = start
-            start_day = start.strftime("%d")
-            start_date = start.date()
-            start_month = start.strftime("%m")
-            start_year = start.strftime("%y")
-            start_hour = start.strftime("%H")
-            start_minute = start.strftime("%M")
-
-            end = start + timedelta(seconds=video["duration"])
-            end_hour = end.strftime("%H")
-            end_minute = end.strftime("%M")
-
-            try:
-                channel_number = CHANNELS_FREE[video["channel"]]
-            except KeyError:
-                logger.error(
-                    "La chaine " + video["channel"] + " n'est pas "
-                    "présente dans le fichier channels_free.py"
-                )
-                continue
+        program_with_workers(settings, driver, programmes, channel_index, outcomes)
+
+    try:
+        if driver is not None:
+            program(driver)
+            return True
+
+        with tracer.span("browser_start"):
+            driver = start_browser()
+        with driver:
+            if not enforce_security_policy(
+                settings.freebox_server_ip, settings.https, settings.security_strict_mode
+            ):
+                return False
+            tracer.instrument_driver(driver)
+            with tracer.span("login"):
+                open_freebox_os(driver, settings.freebox_server_ip, settings.https)
+                login(driver, settings.admin_password)
+            program(driver)
+        return True
+    except FreeboxOSError as e:
+        logger.error(str(e))
+    except Exception as e:
+        logger.error("An unexpected error occurred:")
+        logger.error("Exception type: %s", type(e).__name__)
+        logger.error("Exception message: %s", str(e)[:100])
+    return False
+
+def preflight(settings):
+    """Check that the Freebox can be used before recording. Return a bool."""
+    if not prepare_session(settings):
+        return False
+
+    if settings.https is False:
+        result = probe("http://" + settings.freebox_server_ip)
+
+        if result.title != "Freebox OS":
+            logger.error(
+                "Imposible to connect to the Freebox server. Exit programme."
+            )
+            return False
+
+    if settings.recording_backend == "api":
+        return enforce_security_policy(
+            settings.freebox_server_ip, settings.https, settings.security_strict_mode
+        )
+    return True
+
+def handle_sigterm():
+    """
+    On a first SIGTERM, stop the run once the current programme is saved,
+    so that the next run resumes it; exit at once on a second one.
+    """
+    def stop(signum, frame):
+        if RUN_STOP.is_set():
+            sys.exit(128 + signum)
+        logger.warning("SIGTERM reçu: arrêt après le programme en cours.")
+        RUN_STOP.set()
+
+    signal.signal(signal.SIGTERM, stop)
+
+def run(settings, driver=None):
+    """
+    Program the recordings of progs_to_record.json. Return True when the
+    run completed and the feed of info_progs.json was stored as the
+    reference of the next run. Otherwise the journal of the programmes
+    already programmed is kept for the next run.
+    """
+    # The whole feed is read once here, so that a file corrupted after its
+    # first programmes stops the run before the Freebox is touched.
+    try:
+        info_progs_empty = sum(1 for _ in iter_programmes(INFO_PROGS_FILE)) == 0
+    except FileNotFoundError:
+        logger.error(
+            "No info_progs.json file. Need to check curl command or "
+            "internet connection. Exit programme."
+        )
+        return False
+    except json.JSONDecodeError:
+        logger.error(
+            "Invalid JSON data in info_progs.json file. The file may be empty or corrupted."
+        )
+        return False
 
-            if len(starting) < MAX_SIM_RECORDINGS:
-                starting.append((start, end))
-                to_record = True
+    # The programmes already over are dropped as they are read; the rest
+    # goes through the planning as a generator.
+    now = datetime.now(ZoneInfo("Europe/Paris"))
+    data = iter_programmes(PROGS_TO_RECORD_FILE, not_before=now)
+    try:
+        first = next(data, None)
+    except FileNotFoundError:
+        logger.error(
+            "No progs_to_record.json file. Exit programme."
+        )
+        return False
+
+    RUN_STOP.clear()
+    with StateStore() as store, RunJournal(not_before=now) as journal:
+        # Renames only are not a no-op: the feed must not be stored before
+        # they are applied.
+        if info_progs_empty or (first is None and not has_renames(settings, now)):
+            run_id = store.start_run(settings.recording_backend)
+            store.commit_feed(iter_programmes(INFO_PROGS_FILE, not_before=now), now)
+            journal.clear()
+            store.finish_run(run_id, DONE)
+            logger.info("No data to record programmes. Exit programme.")
+            return True
+        if first is not None:
+            data = itertools.chain([first], data)
+
+        with tracer.span("preflight"):
+            ready = preflight(settings)
+        if not ready:
+            return False
+
+        run_id = store.start_run(settings.recording_backend)
+        outcomes = JournaledOutcomes(journal)
+        completed = False
+        try:
+            if settings.recording_backend == "api":
+                recorded = record_with_api(settings, data, outcomes, journal)
             else:
-                if starting[-MAX_SIM_RECORDINGS][1] < start:
-                    starting.append((start, end))
-                    to_record = True
-                else:
-                    to_record = False
-
-            if to_record:
-                text_to_click = "Programmer un enregistrement"
-                xpath = f"//span[text()='{text_to_click}']"
-                programmer_enregistrements = find_element_with_retries(driver, By.XPATH, xpath)
-                sleep(1)
-                try:
-                    programmer_enregistrements.click()
-                except ElementClickInterceptedException as e:
-                    logger.error("A ElementClickInterceptedException occurred.")
-                    logger.error(
-                        "Impossible de programmer les enregistrements. "
-                        "Une fenêtre d'information empêche probablement "
-                        "de pouvoir clicker sur le bouton programmer un "
-                        "enregistrement."
-                    )
-                    driver.quit()
-                    exit()
-                sleep(3)
-                channel_uuid = driver.find_element("name", "channel_uuid")
-                sleep(1)
-                n = 0
-                follow_record = True
-                while channel_uuid.get_attribute("value").split("/")[0] != channel_number:
-                    channel_uuid.clear()
-                    sleep(1)
-                    if last_channel.split("/")[0] != channel_number:
-                        channel_uuid.send_keys(channel_number)
-                    else:
-                        channel_uuid.click()
-                        sleep(1)
-                        channel_uuid.clear()
-                        sleep(3)
-                        channel_uuid.send_keys(last_channel)
-                        sleep(1)
-                        channel_uuid.click()
-                    sleep(1)
-                    channel_uuid.send_keys(Keys.RETURN)
-                    sleep(1)
-                    last_channel = channel_uuid.get_attribute("value")
-                    n += 1
-                    if n > 10:
-                        logger.error(
-                            "Impossible de sélectionner la chaîne. Merci de "
-                            "vérifier si la chaine n°" + channel_number + " qui "
-                            "correspond à la chaine " + video["channel"] + " "
-                            "de MEDIA-select est bien présente dans la liste des "
-                            "chaines Freebox. "
-                        )
-                        follow_record = False
-                        break
-                if follow_record:
-                    date = driver.find_element("name", "date")
-                    date.click()
-                    sleep(1)
-                    day_difference = (start_date - now_date).days
-                    if day_difference == 0:
-                        text_to_click = "Aujourd"
-                    elif day_difference == 1:
-                        text_to_click = "Demain"
-                    elif day_difference == 2:
-                        text_to_click = "jours"
-                    else:
-                        text_to_click = start_day + " " + translate_month(start_month)
-                    xpath = f"//li[contains(text(), '{text_to_click}') and not(contains(text(), 'TV'))]"
-                    try:
-                        day_click = driver.find_element(By.XPATH, xpath)
-                    except NoSuchElementException as e:
-                        logger.error("A NoSuchElementException occurred.")
-                        logger.error(
-                            "Impossible de trouver la date pour le programme %s. Le "
-                            "programme ne sera pas enregistré.",
-                            validate_video_title(video['title'])
-                        )
-                        cancel_record(driver)
-                        continue
-                    day_click.click()
-                    sleep(1)
-                    to_cancel = False
-                    actual_start = "943463167"
-                    loop_counter = 0
-                    while True:
-                        start_time = driver.find_element("name", "start_time")
-                        start_time.clear()
-                        sleep(0.5)
-                        start_time.send_keys(start_hour + ":" + start_minute)
-                        try:
-                            WebDriverWait(driver, 10).until(
-                                lambda d: start_time.get_attribute("value") == start_hour + ":" + start_minute
-                            )
-                        except:
-                            logger.error("Timeout: The input field did not update to the correct time.")
-
-                        actual_start = start_time.get_attribute("value")
-
-                        if actual_start == start_hour + ":" + start_minute:
-                            break
-                        loop_counter += 1
-                        if loop_counter > 4:
-                            logger.error(
-                                "Impossible de saisir l'heure de début pour le "
-                                "programme %s. Le programme ne sera pas enregistré.",
-                                validate_video_title(video['title'])
-                            )
-                            to_cancel = True
-                            break
-                    sleep(1)
-                    start_time.send_keys(Keys.RETURN)
-                    sleep(1)
-                    actual_end = "943463167"
-                    loop_counter = 0
-                    while True:
-                        end_time = driver.find_element("name", "end_time")
-                        end_time.clear()
-                        sleep(0.5)
-                        end_time.send_keys(end_hour + ":" + end_minute)
-                        try:
-                            WebDriverWait(driver, 10).until(
-                                lambda d: end_time.get_attribute("value") == end_hour + ":" + end_minute
-                            )
-                        except:
-                            logger.error("Timeout: The input field did not update to the correct time.")
-
-                        actual_end = end_time.get_attribute("value")
-
-                        if actual_end == end_hour + ":" + end_minute:
-                            break
-                        loop_counter += 1
-                        if loop_counter > 4:
-                            logger.error(
-                                "Impossible de saisir l'heure de fin pour le "
-                                "programme %s. Le programme ne sera pas enregistré.",
-                                validate_video_title(video['title'])
-                            )
-                            to_cancel = True
-                            break
-                    if to_cancel:
-                        cancel_record(driver)
-                    else:
-                        sleep(1)
-                        end_time.send_keys(Keys.RETURN)
-                        sleep(1)
-                        if MEDIA_SELECT_TITLES:
-                            name_prog = driver.find_element("name", "name")
-                            try:
-                                name_prog.clear()
-                                sleep(1)
-                                name_prog.send_keys(validate_video_title(video["title"]))
-                                sleep(1)
-                            except ElementNotInteractableException:
-                                logger.error(
-                                    "Une ElementNotInteractableException est apparue. "
-                                    "Le titre de MEDIA select ne sera pas utilisé pour "
-                                    "nommer le vidéo."
-                                )
-                        text_to_click = "Sauvegarder"
-                        xpath = f"//span[text()='{text_to_click}']"
-                        sauvegarder = driver.find_element(By.XPATH, xpath)
-                        sauvegarder.click()
-                        sleep(5)
-                        try:
-                            internal_error = driver.find_element(
-                                By.XPATH, "//div[contains(text(), 'Erreur interne')]"
-                            )
-                            logger.error(
-                                "Une erreur interne de la Freebox est survenue. "
-                                "La programmation des enregistrements n'a pas "
-                                "pu être réalisée. Merci de vérifier si le disque "
-                                "dur n'est pas plein."
-                            )
-                            break
-                        except NoSuchElementException:
-                            pass
-                else:
-                    cancel_record(driver)
-
-        sleep(6)
-        driver.quit()
-
-        atomic_file_copy(INFO_PROGS_FILE, INFO_PROGS_LAST_FILE)
-
-except Exception as e:
-    logger.error("An unexpected error occurred:")
-    logger.error("Exception type: %s", type(e).__name__)
-    logger.error("Exception message: %s", str(e)[:100])
+                recorded = record_with_browser(settings, data, driver, outcomes, journal)
+            completed = recorded and not RUN_STOP.is_set()
+            if completed:
+                store.commit_feed(iter_programmes(INFO_PROGS_FILE, not_before=now), now)
+                journal.clear()
+            elif recorded:
+                logger.warning(
+                    "Exécution interrompue: les programmes restants seront "
+                    "traités par la prochaine exécution."
+                )
+        finally:
+            store.record_outcomes(run_id, outcomes)
+            store.finish_run(run_id, DONE if completed else ABORTED)
+    return completed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Program the recordings of progs_to_record.json on the Freebox."
+    )
+    parser.add_argument(
+        "--trace", action="store_true",
+        help="log the time spent in each step of the run",
+    )
+    parser.add_argument(
+        "--profile", nargs="?", const=str(PROFILE_FILE), metavar="FILE",
+        help=f"like --trace, and write a cProfile dump (default: {PROFILE_FILE})",
+    )
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    handle_sigterm()
+    if args.trace or args.profile:
+        tracer.enable()
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        with tracer.span("startup"):
+            settings = prepare_settings()
+        run(settings)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            logger.info("cProfile dump written to %s", args.profile)
+        if tracer.enabled:
+            summary = tracer.summary()
+            logger.info("Run trace (seconds):\n%s", summary)
+            print(summary)
+        stop_queued_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,504 @@
+import logging
+import re
+
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from selenium import webdriver
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.firefox.service import Service
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import WebDriverException, ElementNotInteractableException, ElementClickInterceptedException, TimeoutException
+
+from config_freeboxos import GECKODRIVER_PATH
+from freebox_api import DEFAULT_BOUQUET
+from module_freeboxos import build_url, is_snap_installed, is_firefox_snap
+from programme import FAILED, PROGRAMMED, SKIPPED
+from reconcile import build_programmed_index
+from run_trace import tracer
+from waits import (
+    any_of,
+    element_clickable,
+    element_gone,
+    element_visible,
+    field_value_matches,
+    wait_until,
+    xhr_settled,
+)
+
+logger = logging.getLogger("module_freeboxos")
+
+PASSWORD_FIELD = (By.ID, "fbx-password")
+INVALID_PASSWORD = (By.XPATH, "//div[contains(text(), 'Identifiants invalides')]")
+INTERNAL_ERROR = (By.XPATH, "//div[contains(text(), 'Erreur interne')]")
+PROGRAMMER_BUTTON = (By.XPATH, "//span[text()='Programmer un enregistrement']")
+SAVE_BUTTON = (By.XPATH, "//span[text()='Sauvegarder']")
+CANCEL_BUTTON = (By.XPATH, "//span[text()='Annuler']")
+CHANNEL_FIELD = (By.NAME, "channel_uuid")
+DATE_FIELD = (By.NAME, "date")
+DATE_PICKER_TODAY = (By.XPATH, "//li[contains(text(), 'Aujourd')]")
+
+PVR_PATH = "/login.php#Fbx.os.app.pvr.app"
+API_PATH = "/api/v8/"
+
+API_FETCH_SCRIPT = """
+var done = arguments[arguments.length - 1];
+fetch(arguments[0], {credentials: 'same-origin', headers: {'Accept': 'application/json'}})
+    .then(function (response) { return response.json(); })
+    .then(function (body) { done(body); })
+    .catch(function () { done(null); });
+"""
+
+# Sets the channel combo of the recording form to a channel uuid and
+# returns the value displayed by the field.
+CHANNEL_SET_SCRIPT = """
+var field = arguments[0], uuid = arguments[1], label = arguments[2];
+if (window.Ext && Ext.ComponentQuery) {
+    var combo = Ext.ComponentQuery.query('combobox[name=channel_uuid]')[0];
+    if (combo) {
+        combo.setValue(uuid);
+        return combo.getRawValue();
+    }
+}
+field.value = label;
+field.dispatchEvent(new Event('change', {bubbles: true}));
+return field.value;
+"""
+
+DATE_LABELS_SCRIPT = """
+return Array.prototype.map.call(document.querySelectorAll('li'), function (li) {
+    return li.textContent;
+});
+"""
+
+month_names_fr = {
+    '01': 'Jan',
+    '02': 'Fév',
+    '03': 'Mar',
+    '04': 'Avr',
+    '05': 'Mai',
+    '06': 'Juin',
+    '07': 'Juil',
+    '08': 'Août',
+    '09': 'Sept',
+    '10': 'Oct',
+    '11': 'Nov',
+    '12': 'Déc'
+}
+
+
+class FreeboxOSError(Exception):
+    """Freebox OS cannot be used any more: the run must stop."""
+
+
+DATE_LABEL_DAY_MONTH = re.compile(
+    r"\b(\d{1,2}) (" + "|".join(month_names_fr.values()) + r")\b"
+)
+DATE_LABEL_IN_DAYS = re.compile(r"(\d+) jours")
+month_numbers_fr = {name: int(number) for number, name in month_names_fr.items()}
+
+
+def parse_date_label(label, today):
+    """
+    Calendar date of an entry of the date picker ("Aujourd'hui", "Demain",
+    "Dans 2 jours", "Lun. 20 Oct"...), or None when it is not a date.
+    """
+    if "TV" in label:
+        return None
+    if label.startswith("Aujourd"):
+        return today
+    if label.startswith("Demain"):
+        return today + timedelta(days=1)
+    match = DATE_LABEL_IN_DAYS.search(label)
+    if match:
+        return today + timedelta(days=int(match.group(1)))
+    if "jours" in label:
+        return today + timedelta(days=2)
+    match = DATE_LABEL_DAY_MONTH.search(label)
+    if match is None:
+        return None
+    day, month = int(match.group(1)), month_numbers_fr[match.group(2)]
+    try:
+        date = today.replace(month=month, day=day)
+        if date < today:
+            date = date.replace(year=today.year + 1)
+    except ValueError:
+        return None
+    return date
+
+
+class DatePickerIndex:
+    """Calendar date -> label of the entries of the date picker."""
+
+    def __init__(self, labels, today):
+        self.labels = {}
+        for label in labels:
+            label = " ".join(label.split())
+            date = parse_date_label(label, today)
+            if date is not None:
+                self.labels.setdefault(date, label)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def covers(self, date):
+        return date in self.labels
+
+    def label(self, date):
+        return self.labels.get(date)
+
+    def period(self):
+        """(first, last) date offered by the picker."""
+        return min(self.labels), max(self.labels)
+
+def wait_quietly(driver, condition, step):
+    """Like wait_until() but a timeout is not an error: the caller checks the result."""
+    try:
+        return wait_until(driver, condition, step)
+    except TimeoutException:
+        return None
+
+def start_browser():
+    """Start a headless Firefox."""
+    if is_snap_installed() and is_firefox_snap():
+        service = Service(executable_path="/snap/bin/firefox.geckodriver")
+    else:
+        service = Service(executable_path=str(GECKODRIVER_PATH))
+
+    options = webdriver.FirefoxOptions()
+    options.add_argument("start-maximized")
+    options.add_argument("--headless")
+    return webdriver.Firefox(service=service, options=options)
+
+def open_freebox_os(driver, server_ip, https):
+    """Load the PVR application of Freebox OS (login page)."""
+    try:
+        driver.get(build_url(https, server_ip, PVR_PATH))
+    except WebDriverException as e:
+        if 'net::ERR_ADDRESS_UNREACHABLE' in e.msg:
+            raise FreeboxOSError(
+                f"The programme cannot reach the address {server_ip} . Exit programme."
+            )
+        logger.error(f"Exception type: {type(e).__name__}")
+        raise FreeboxOSError("A WebDriverException occurred. Exiting the program.")
+
+def login(driver, password):
+    """Log in Freebox OS with the admin password."""
+    try:
+        field = wait_until(driver, element_clickable(PASSWORD_FIELD), "page_load")
+    except TimeoutException:
+        raise FreeboxOSError("Cannot connect to Freebox OS. Exit programme.")
+    field.click()
+    field.send_keys(password)
+    field.send_keys(Keys.RETURN)
+
+    try:
+        wait_until(
+            driver,
+            any_of(element_visible(INVALID_PASSWORD), element_clickable(PROGRAMMER_BUTTON)),
+            "login",
+        )
+    except TimeoutException:
+        logger.error("Timeout: Freebox OS did not answer to the login.")
+
+    if driver.find_elements(*INVALID_PASSWORD):
+        raise FreeboxOSError(
+            "Le mot de passe administrateur de la Freebox est invalide. "
+            "La programmation des enregistrements n'a pas "
+            "pu être réalisée. Merci de vérifier le mot de passe."
+        )
+
+def is_logged_in(driver):
+    """True when the PVR application is displayed (session still valid)."""
+    wait_quietly(
+        driver,
+        any_of(element_clickable(PASSWORD_FIELD), element_clickable(PROGRAMMER_BUTTON)),
+        "page_load",
+    )
+    return bool(driver.find_elements(*PROGRAMMER_BUTTON)) and not any(
+        element.is_displayed() for element in driver.find_elements(*PASSWORD_FIELD)
+    )
+
+def fetch_api(driver, path):
+    """GET an API path with the session of the logged-in page. Return None on failure."""
+    try:
+        body = driver.execute_async_script(API_FETCH_SCRIPT, API_PATH + path)
+    except WebDriverException:
+        return None
+    if not isinstance(body, dict) or not body.get("success"):
+        return None
+    return body.get("result")
+
+def fetch_channels(driver):
+    """Read the channel list of the Freebox. Return None when unavailable."""
+    return fetch_api(driver, f"tv/bouquets/{DEFAULT_BOUQUET}/channels/")
+
+def fetch_programmed_index(driver, channel_index):
+    """Read the recordings programmed on the Freebox. Return None when unavailable."""
+    if channel_index is None:
+        return None
+    recordings = fetch_api(driver, "pvr/programmed/")
+    if recordings is None:
+        return None
+    return build_programmed_index(recordings, channel_index.channel_uuids())
+
+def cancel_record(driver):
+    cancel = wait_until(driver, element_clickable(CANCEL_BUTTON), "cancel")
+    cancel.click()
+    if wait_quietly(driver, element_gone(CHANNEL_FIELD), "cancel") is None:
+        logger.error("Timeout: the recording form did not close after cancel.")
+
+def open_record_form(driver):
+    """Click on 'Programmer un enregistrement' and return the channel field."""
+    try:
+        programmer_enregistrements = wait_until(
+            driver, element_clickable(PROGRAMMER_BUTTON), "open_form"
+        )
+    except TimeoutException:
+        raise FreeboxOSError(
+            "Impossible de trouver le bouton programmer un enregistrement."
+        )
+    try:
+        programmer_enregistrements.click()
+    except ElementClickInterceptedException:
+        logger.error("A ElementClickInterceptedException occurred.")
+        raise FreeboxOSError(
+            "Impossible de programmer les enregistrements. "
+            "Une fenêtre d'information empêche probablement "
+            "de pouvoir clicker sur le bouton programmer un "
+            "enregistrement."
+        )
+    return wait_until(driver, element_visible(CHANNEL_FIELD), "open_form")
+
+def xpath_literal(text):
+    if '"' not in text:
+        return f'"{text}"'
+    return f"'{text}'"
+
+def read_date_picker(driver, today):
+    """Index the entries of the opened date picker. Return None when it is empty."""
+    if wait_quietly(driver, element_visible(DATE_PICKER_TODAY), "date") is None:
+        return None
+    date_index = DatePickerIndex(driver.execute_script(DATE_LABELS_SCRIPT) or [], today)
+    return date_index if len(date_index) else None
+
+def index_date_picker(driver, today):
+    """
+    Open a recording form once to index the entries of its date picker,
+    then close it. Return None when the picker cannot be read.
+    """
+    open_record_form(driver)
+    date_index = None
+    try:
+        wait_until(driver, element_clickable(DATE_FIELD), "date").click()
+        date_index = read_date_picker(driver, today)
+        today_entry = driver.find_elements(*DATE_PICKER_TODAY)
+        if today_entry:
+            today_entry[0].click()
+            wait_quietly(driver, element_gone(DATE_PICKER_TODAY), "date")
+    except TimeoutException:
+        pass
+    cancel_record(driver)
+    return date_index
+
+def select_date(driver, date, date_index, today):
+    """
+    Select `date` in the date picker of the open form. `date_index` is None
+    when the picker could not be indexed beforehand; it is then read now.
+    Return False when the picker does not offer the date.
+    """
+    wait_until(driver, element_clickable(DATE_FIELD), "date").click()
+    if date_index is None:
+        date_index = read_date_picker(driver, today)
+    label = date_index.label(date) if date_index else None
+    if label is None:
+        return False
+    option = wait_until(
+        driver,
+        element_clickable((By.XPATH, f"//li[normalize-space(.)={xpath_literal(label)}]")),
+        "date",
+    )
+    option.click()
+    wait_quietly(driver, element_gone(DATE_PICKER_TODAY), "date")
+    return True
+
+def set_time_field(driver, field_name, value, attempts=5):
+    """Type a HH:MM value in a time field and validate it. Return True on success."""
+    for _ in range(attempts):
+        field = wait_until(driver, element_clickable((By.NAME, field_name)), "time_field")
+        field.clear()
+        field.send_keys(value)
+        if wait_quietly(driver, field_value_matches(field, lambda v: v == value), "time_field"):
+            field.send_keys(Keys.RETURN)
+            return True
+        logger.error("Timeout: The input field did not update to the correct time.")
+    return False
+
+def select_channel(driver, field, channel_number, channel=None):
+    """
+    Select the channel of the recording form in one step: through the
+    channel combo when the Freebox channel (uuid and name) is known, else by
+    typing its number once. Return True when the field shows the channel.
+    """
+    def selected(value):
+        return value.split("/")[0] == channel_number
+
+    if selected(field.get_attribute("value") or ""):
+        return True
+    if channel is not None:
+        label = f"{channel_number}/{channel.get('name', channel_number)}"
+        value = driver.execute_script(CHANNEL_SET_SCRIPT, field, channel["uuid"], label)
+        if selected(value or ""):
+            return True
+
+    field.clear()
+    field.send_keys(channel_number)
+    wait_quietly(driver, xhr_settled(), "channel")
+    field.send_keys(Keys.RETURN)
+    return wait_quietly(driver, field_value_matches(field, selected), "channel") is not None
+
+def program_recordings(driver, programmes, media_select_titles, channel_index=None,
+                       outcomes=None, stop=None):
+    """
+    Fill the 'Programmer un enregistrement' form for each
+    (video, start, end, channel_number) of `programmes`.
+
+    A (programme, outcome) pair is appended to `outcomes` as soon as the
+    programme is handled, so that the list is complete up to an exception.
+    `stop` is a threading.Event shared by parallel sessions: it is set on a
+    FAILED programme, and the loop ends once it is set. Return `outcomes`.
+    """
+    if outcomes is None:
+        outcomes = []
+    if not programmes:
+        return outcomes
+    now_date = datetime.now().astimezone(ZoneInfo("Europe/Paris")).date()
+
+    with tracer.span("date_picker"):
+        date_index = index_date_picker(driver, now_date)
+    if date_index is None:
+        logger.warning("Impossible de lire les dates proposées par Freebox OS.")
+
+    for programme in programmes:
+        if stop is not None and stop.is_set():
+            break
+        video, start, end, channel_number = programme
+        if date_index is not None and not date_index.covers(start.date()):
+            first, last = date_index.period()
+            logger.error(
+                "Le programme %s du %s est en dehors de la période proposée par "
+                "Freebox OS (du %s au %s). Le programme ne sera pas enregistré.",
+                video.title, start.strftime("%d/%m/%Y"),
+                first.strftime("%d/%m/%Y"), last.strftime("%d/%m/%Y"),
+            )
+            outcomes.append((programme, SKIPPED))
+            continue
+        channel = channel_index.by_number.get(channel_number) if channel_index else None
+        with tracer.span("programme"):
+            outcome = program_recording(
+                driver, video, start, end, channel_number, channel,
+                date_index, now_date, media_select_titles,
+            )
+        outcomes.append((programme, outcome))
+        if outcome == FAILED:
+            if stop is not None:
+                stop.set()
+            break
+
+    wait_quietly(driver, xhr_settled(), "settle")
+    return outcomes
+
+def program_recording(driver, video, start, end, channel_number, channel,
+                      date_index, now_date, media_select_titles):
+    """
+    Program one recording with the web form. `channel` is the Freebox
+    channel of channel_number, or None when the channel list is unknown.
+    Return PROGRAMMED, SKIPPED, or FAILED when the run must stop.
+    """
+    start_time = f"{start.hour:02d}:{start.minute:02d}"
+    end_time = f"{end.hour:02d}:{end.minute:02d}"
+
+    with tracer.span("open_form"):
+        channel_uuid = open_record_form(driver)
+
+    with tracer.span("channel"):
+        channel_selected = select_channel(driver, channel_uuid, channel_number, channel)
+    if not channel_selected:
+        logger.error(
+            "Impossible de sélectionner la chaîne. Merci de "
+            "vérifier si la chaine n°" + channel_number + " qui "
+            "correspond à la chaine " + video.channel + " "
+            "de MEDIA-select est bien présente dans la liste des "
+            "chaines Freebox. "
+        )
+        cancel_record(driver)
+        return SKIPPED
+
+    with tracer.span("date"):
+        date_selected = select_date(driver, start.date(), date_index, now_date)
+    if not date_selected:
+        logger.error(
+            "Impossible de trouver la date pour le programme %s. Le "
+            "programme ne sera pas enregistré.",
+            video.title
+        )
+        cancel_record(driver)
+        return SKIPPED
+
+    with tracer.span("start_time"):
+        start_time_set = set_time_field(driver, "start_time", start_time)
+    if not start_time_set:
+        logger.error(
+            "Impossible de saisir l'heure de début pour le "
+            "programme %s. Le programme ne sera pas enregistré.",
+            video.title
+        )
+        cancel_record(driver)
+        return SKIPPED
+
+    with tracer.span("end_time"):
+        end_time_set = set_time_field(driver, "end_time", end_time)
+    if not end_time_set:
+        logger.error(
+            "Impossible de saisir l'heure de fin pour le "
+            "programme %s. Le programme ne sera pas enregistré.",
+            video.title
+        )
+        cancel_record(driver)
+        return SKIPPED
+
+    if media_select_titles:
+        with tracer.span("title"):
+            title = video.title
+            try:
+                name_prog = wait_until(driver, element_clickable((By.NAME, "name")), "title")
+                name_prog.clear()
+                name_prog.send_keys(title)
+                wait_quietly(driver, field_value_matches(name_prog, lambda value: value == title), "title")
+            except (ElementNotInteractableException, TimeoutException):
+                logger.error(
+                    "Une ElementNotInteractableException est apparue. "
+                    "Le titre de MEDIA select ne sera pas utilisé pour "
+                    "nommer le vidéo."
+                )
+
+    with tracer.span("save"):
+        sauvegarder = wait_until(driver, element_clickable(SAVE_BUTTON), "save")
+        sauvegarder.click()
+        try:
+            wait_until(
+                driver,
+                any_of(element_gone(CHANNEL_FIELD), element_visible(INTERNAL_ERROR)),
+                "save",
+            )
+        except TimeoutException:
+            logger.error("Timeout: the recording form did not close after saving.")
+    if driver.find_elements(*INTERNAL_ERROR):
+        logger.error(
+            "Une erreur interne de la Freebox est survenue. "
+            "La programmation des enregistrements n'a pas "
+            "pu être réalisée. Merci de vérifier si le disque "
+            "dur n'est pas plein."
+        )
+        return FAILED
+    return PROGRAMMED
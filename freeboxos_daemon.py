@@ -0,0 +1,237 @@
+"""
+Optional resident process keeping one logged-in Freebox OS session.
+
+Start it once per user session (e.g. with a "@reboot" crontab line):
+
+    python3 freeboxos_daemon.py
+
+cron_select.py then submits each new progs_to_record.json batch through
+submit_batch() instead of starting Firefox and logging in again. When the
+daemon is not running, cron_select.py runs freeboxos in its own process.
+"""
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+
+from config_freeboxos import BASE_DIR
+
+logger = logging.getLogger("module_freeboxos")
+
+SOCKET_PATH = BASE_DIR / "freeboxos_daemon.sock"
+KEEPALIVE_INTERVAL = 300  # seconds
+CLIENT_TIMEOUT = 5  # seconds
+
+
+def submit_batch(socket_path=SOCKET_PATH):
+    """
+    Ask the daemon to program the current progs_to_record.json.
+    Return False when no daemon is listening, so the caller can fall back
+    to a one-shot run.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(CLIENT_TIMEOUT)
+            client.connect(str(socket_path))
+            client.sendall(json.dumps({"action": "run"}).encode() + b"\n")
+            answer = json.loads(client.makefile().readline() or "{}")
+    except (OSError, ValueError):
+        return False
+    return bool(answer.get("accepted"))
+
+
+class WarmBrowser:
+    """A headless Firefox kept logged in Freebox OS between batches."""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.driver = None
+        self.lock = threading.Lock()
+
+    def _restart(self):
+        from freeboxos_browser import login, open_freebox_os, start_browser
+
+        self.close()
+        self.driver = start_browser()
+        open_freebox_os(self.driver, self.settings.freebox_server_ip, self.settings.https)
+        login(self.driver, self.settings.admin_password)
+        logger.info("Freebox OS session opened by the daemon.")
+
+    def ensure_logged_in(self):
+        """Reuse the session when still valid, otherwise log in again."""
+        from freeboxos_browser import is_logged_in, login
+        from selenium.common.exceptions import WebDriverException
+
+        if self.driver is None:
+            self._restart()
+            return
+        try:
+            if not is_logged_in(self.driver):
+                logger.info("Freebox OS session expired: login again.")
+                login(self.driver, self.settings.admin_password)
+        except WebDriverException:
+            logger.warning("Browser of the daemon is not responding: restart it.")
+            self._restart()
+
+    def keep_alive(self):
+        """Reload the PVR page so the Freebox OS session does not expire."""
+        from selenium.common.exceptions import WebDriverException
+
+        with self.lock:
+            try:
+                if self.driver is not None:
+                    self.driver.refresh()
+                self.ensure_logged_in()
+            except WebDriverException:
+                self.close()
+            except Exception as e:
+                logger.error("Keep-alive of the daemon failed: %s", type(e).__name__)
+
+    def close(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+            self.driver = None
+
+
+class BatchRunner:
+    """Run the submitted batches one at a time; pending requests coalesce."""
+
+    def __init__(self, settings, browser):
+        self.settings = settings
+        self.browser = browser
+        self.pending = threading.Event()
+
+    def submit(self):
+        self.pending.set()
+
+    def run_batch(self):
+        import freeboxos
+
+        if self.browser is None:
+            freeboxos.run(self.settings)
+            return
+        with self.browser.lock:
+            try:
+                self.browser.ensure_logged_in()
+            except Exception as e:
+                logger.error("The daemon cannot open Freebox OS: %s", e)
+                self.browser.close()
+                return
+            try:
+                freeboxos.run(self.settings, driver=self.browser.driver)
+            except Exception:
+                # The browser may be left anywhere: start afresh next batch.
+                self.browser.close()
+                raise
+
+    def loop(self, stop):
+        while not stop.is_set():
+            if not self.pending.wait(timeout=1) or stop.is_set():
+                continue
+            self.pending.clear()
+            # The runner must survive a failed batch, the daemon keeps
+            # accepting the next ones.
+            try:
+                self.run_batch()
+            except Exception as e:
+                logger.error(
+                    "A batch of the daemon failed: %s", type(e).__name__, exc_info=True
+                )
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline() or "{}")
+        except ValueError:
+            request = {}
+        if request.get("action") == "run":
+            self.server.runner.submit()
+            answer = {"accepted": True}
+        elif request.get("action") == "ping":
+            answer = {"accepted": True}
+        else:
+            answer = {"accepted": False}
+        self.wfile.write(json.dumps(answer).encode() + b"\n")
+
+
+def keep_alive_loop(browser, stop):
+    while not stop.wait(KEEPALIVE_INTERVAL):
+        browser.keep_alive()
+
+
+def main():
+    import freeboxos
+
+    freeboxos.setup_logging()
+    settings = freeboxos.prepare_settings()
+    if not freeboxos.prepare_session(settings):
+        sys.exit(1)
+
+    if not freeboxos.enforce_security_policy(
+        settings.freebox_server_ip, settings.https, settings.security_strict_mode
+    ):
+        sys.exit(1)
+
+    browser = None
+    if settings.recording_backend == "selenium":
+        browser = WarmBrowser(settings)
+        with browser.lock:
+            try:
+                browser.ensure_logged_in()
+            except Exception as e:
+                logger.error("The daemon cannot open Freebox OS: %s", e)
+                browser.close()
+                sys.exit(1)
+
+    stop = threading.Event()
+    runner = BatchRunner(settings, browser)
+    runner_thread = threading.Thread(target=runner.loop, args=(stop,), daemon=True)
+    runner_thread.start()
+    if browser is not None:
+        threading.Thread(target=keep_alive_loop, args=(browser, stop), daemon=True).start()
+
+    if SOCKET_PATH.exists():
+        SOCKET_PATH.unlink()
+    old_umask = os.umask(0o177)
+    try:
+        server = socketserver.ThreadingUnixStreamServer(str(SOCKET_PATH), RequestHandler)
+    finally:
+        os.umask(old_umask)
+    server.runner = runner
+
+    def terminate(signum, frame):
+        # Stop the current batch after its current programme, as the cron
+        # path does: the journal resumes it next time.
+        stop.set()
+        freeboxos.RUN_STOP.set()
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, terminate)
+    logger.info("freeboxos daemon listening on %s", SOCKET_PATH.name)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        freeboxos.RUN_STOP.set()
+        server.server_close()
+        SOCKET_PATH.unlink(missing_ok=True)
+        # Let the current batch record its outcomes and close its run.
+        runner_thread.join()
+        if browser is not None:
+            with browser.lock:
+                browser.close()
+
+
+if __name__ == "__main__":
+    main()
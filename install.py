@@ -15,9 +15,17 @@ from selenium.webdriver.common.by import By
 from selenium.common.exceptions import WebDriverException, SessionNotCreatedException
 
 from time import sleep
-from subprocess import Popen, PIPE, run, CalledProcessError
-
-from module_freeboxos import get_website_title, is_snap_installed, is_firefox_snap
+from urllib.parse import urlsplit
+from subprocess import PIPE, run, CalledProcessError
+
+from freebox_probe import (
+    DISCOVERY_TIMEOUT,
+    FREEBOX_OS_TITLE,
+    discover,
+    local_candidates,
+    probe,
+)
+from module_freeboxos import is_snap_installed, is_firefox_snap
 
 user = os.getenv("USER")
 
@@ -29,6 +37,22 @@ logging.basicConfig(
 
 logger = logging.getLogger("module_freeboxos")
 
+
+def find_freebox():
+    """
+    Probe at once the default gateway and mafreebox.freebox.fr. Print and
+    return the address and the page title of the best candidate.
+    """
+    best = discover(local_candidates())[0]
+    address = urlsplit(best.url).netloc
+    if best.title == FREEBOX_OS_TITLE:
+        print("\nLe programme a trouvé Freebox OS à l'adresse " + address + "\n")
+    else:
+        print("\nLe programme a détecté que votre routeur a l'adresse IP "
+              + address + "\n")
+    return address, best.title
+
+
 answers = ["oui", "non"]
 opciones = ["1", "2", "3"]
 opcion = 5
@@ -106,12 +130,9 @@ if opcion == "1":
     FREEBOX_SERVER_IP = FREEBOX_SERVER_IP.replace("https://", "")
     FREEBOX_SERVER_IP = FREEBOX_SERVER_IP.replace("http://", "")
     FREEBOX_SERVER_IP = FREEBOX_SERVER_IP.rstrip("/")
-    cmd = ["curl", "-sI", "-w", "%{http_code}", "https://" + FREEBOX_SERVER_IP + "/login.php"]
-    http = Popen(cmd, stdout=PIPE, stderr=PIPE, universal_newlines=True)
-    stdout, stderr = http.communicate()
-    http_response = stdout.split()[-1]
+    result = probe("https://" + FREEBOX_SERVER_IP + "/login.php", DISCOVERY_TIMEOUT)
 
-    while http_response != "200":
+    while result.error is not None:
         FREEBOX_SERVER_IP = input("\nLa connexion à la Freebox Server a "
             "échoué.\n\nMerci de saisir de nouveau l'adresse à utiliser pour "
             "l'accès distant de votre Freebox.\nCelle-ci peut ressembler à "
@@ -121,27 +142,16 @@ if opcion == "1":
         FREEBOX_SERVER_IP = FREEBOX_SERVER_IP.replace("https://", "")
         FREEBOX_SERVER_IP = FREEBOX_SERVER_IP.replace("http://", "")
         FREEBOX_SERVER_IP = FREEBOX_SERVER_IP.rstrip("/")
-        cmd = ["curl", "-sI", "-w", "%{http_code}", "https://" + FREEBOX_SERVER_IP + "/login.php"]
-        http = Popen(cmd, stdout=PIPE, stderr=PIPE, universal_newlines=True)
-        stdout, stderr = http.communicate()
-        http_response = stdout.split()[-1]
+        result = probe("https://" + FREEBOX_SERVER_IP + "/login.php", DISCOVERY_TIMEOUT)
 
 elif opcion == "2":
-    cmd = ["ip", "route", "show", "default"]
-    ip_ad = Popen(cmd, stdout=PIPE, stderr=PIPE, universal_newlines=True)
-    stdout, stderr = ip_ad.communicate()
-    FREEBOX_SERVER_IP = stdout.split()[2]
-
     print("\nVous avez choisi de vous connecter à votre Freebox par votre "
           "réseau local.")
 
-    print("\nLe programme a détecté que votre routeur "
-          "a l'adresse IP " + FREEBOX_SERVER_IP + "\n\nLe programme va "
-          "maintenant vérifier si celui-ci est celui de la Freebox server\n")
-
-    url = "http://" + FREEBOX_SERVER_IP
+    print("\nLe programme va maintenant rechercher la Freebox server sur "
+          "votre réseau local (routeur et mafreebox.freebox.fr)\n")
 
-    title = get_website_title(url)
+    FREEBOX_SERVER_IP, title = find_freebox()
 
     option = 5
     repeat = False
@@ -186,29 +196,23 @@ elif opcion == "2":
                 "utiliser de VPN avec votre PC/Mac pour pouvoir vous "
                 "connecter.\n\nChoisissez entre 1 et 3: "
             )
-        if option == "1":
-            cmd = ["ip", "route", "show", "default"]
-            ip_ad = Popen(cmd, stdout=PIPE, stderr=PIPE, universal_newlines=True)
-            stdout, stderr = ip_ad.communicate()
-            FREEBOX_SERVER_IP = stdout.split()[2]
-
-            print("\nLe programme a détecté que votre routeur "
-                "a l'adresse IP " + FREEBOX_SERVER_IP + "\n\nLe programme va "
-                "maitenant vérifier si celui-ci est celui de la Freebox server\n")
-        elif option == "2":
+        if option == "2":
             FREEBOX_SERVER_IP = input(
                 "\nVeuillez saisir l'adresse IP de votre Freebox: "
             )
-        else:
+        elif option == "3":
             FREEBOX_SERVER_IP = "mafreebox.freebox.fr"
 
-        option = "5"
-
         print("\nNouvelle tentative de connexion à la Freebox:\n\nVeuillez patienter.")
         print("\n---------------------------------------------------------------\n")
 
-        url = "http://" + FREEBOX_SERVER_IP
-        title = get_website_title(url)
+        if option == "1":
+            FREEBOX_SERVER_IP, title = find_freebox()
+        else:
+            # The address chosen by the user is the only one tried.
+            title = probe("http://" + FREEBOX_SERVER_IP, DISCOVERY_TIMEOUT).title
+
+        option = "5"
 
         repeat = True
         out_prog = "nose"
@@ -420,6 +424,7 @@ if go_on:
     config["HTTPS"] = bool(https)
     config["SENTRY_MONITORING_SDK"] = record_logs.lower() == "oui"
     config["SECURITY_STRICT_MODE"] = True
+    config["RECORDING_BACKEND"] = "selenium"
 
     config_path = f"/home/{user}/.config/select_freeboxos/config.json"
 
@@ -1,24 +1,11 @@
-import requests
 import logging
+import re
 import subprocess
-from bs4 import BeautifulSoup
 
 
 logger = logging.getLogger(__name__)
 
 
-def get_website_title(url):
-    """Get the title of a website."""
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        title = soup.find("title").string.strip()
-        return title
-    except requests.exceptions.RequestException as e:
-        logging.error(f"An error occurred: {e}")
-        return None
-
 def is_snap_installed():
     """Check if Snap is installed on the system."""
     return subprocess.call(["which", "snap"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
@@ -30,3 +17,20 @@ def is_firefox_snap():
         return result.returncode == 0 and "firefox" in result.stdout
     except FileNotFoundError:
         return False
+
+def validate_video_title(title):
+    """Validate video title"""
+    # Allow most characters but remove potentially dangerous ones
+    sanitized_title = re.sub(r'[<>\'"]', '', title)
+    if len(sanitized_title) > 200:
+        sanitized_title = sanitized_title[:200]
+
+    return sanitized_title
+
+def build_url(use_https, server_ip, path=""):
+    """
+    Safely construct URL.
+    """
+    protocol = "https://" if use_https else "http://"
+    full_url = protocol + server_ip + path
+    return full_url
@@ -0,0 +1,172 @@
+"""
+Tuner capacity planning: decide which programmes can be recorded without
+exceeding the number of simultaneous recordings allowed.
+
+The planner is a pure function (no Selenium, no file access):
+
+    admitted = plan_recordings(programmed, candidates, max_sim_recordings)
+
+Run "python3 planner.py 5000" to time it on a random week of programmes.
+"""
+import heapq
+import sys
+
+from bisect import bisect_right
+from datetime import timedelta
+
+SAME_START_SHIFT = timedelta(minutes=1)
+# A candidate is moved at most this many minutes later; reconcile.py looks
+# for the recordings of the Freebox up to this shift.
+MAX_START_SHIFT = 3
+
+
+def shift_same_starts(candidates):
+    """
+    Sort the candidates by start and move a candidate starting at the same
+    minute as the previous one (or before it, after a previous shift) one
+    minute after it. The duration is kept. A candidate which would be moved
+    more than MAX_START_SHIFT minutes is left out.
+    Yield (start, end, payload).
+    """
+    max_shift = SAME_START_SHIFT * MAX_START_SHIFT
+    previous_start = None
+    for start, end, payload in sorted(candidates, key=lambda candidate: candidate[0]):
+        if previous_start is not None and start <= previous_start:
+            shifted = previous_start + SAME_START_SHIFT
+            if shifted - start > max_shift:
+                continue
+            end += shifted - start
+            start = shifted
+        previous_start = start
+        yield start, end, payload
+
+
+class _RangeMax:
+    """Maximum of values[first:last] in O(1), after an O(n log n) build."""
+
+    def __init__(self, values):
+        self.levels = [list(values)]
+        width = 1
+        while 2 * width <= len(values):
+            previous = self.levels[-1]
+            self.levels.append([
+                max(previous[index], previous[index + width])
+                for index in range(len(previous) - width)
+            ])
+            width *= 2
+
+    def max(self, first, last):
+        level = (last - first).bit_length() - 1
+        values = self.levels[level]
+        return max(values[first], values[last - (1 << level)])
+
+
+def _programmed_loads(programmed):
+    """Number of programmed recordings running at the start of each of them."""
+    running = []
+    loads = []
+    for start, end in programmed:
+        heapq.heappush(running, end)
+        while running[0] < start:
+            heapq.heappop(running)
+        loads.append(len(running))
+    # Recordings starting at the same minute all run at that minute.
+    for index in range(len(programmed) - 2, -1, -1):
+        if programmed[index][0] == programmed[index + 1][0]:
+            loads[index] = loads[index + 1]
+    return loads
+
+
+def plan_recordings(programmed, candidates, max_sim_recordings):
+    """
+    Return the admitted candidates as a list of (start, end, payload)
+    sorted by start.
+
+    programmed: iterable of (start, end) already programmed on the Freebox;
+        they always keep their tuner.
+    candidates: iterable of (start, end, payload) to program.
+
+    Two recordings overlap when one ends at or after the start of the
+    other, as the Freebox needs the tuner until the end minute.
+
+    The candidates are swept by start. The load is highest at a start, and
+    the only recordings starting while a candidate runs are programmed
+    ones: a candidate fits when the load at its start and at these
+    programmed starts stays below the limit. The programmed load at each
+    programmed start is computed once; the admitted candidates still
+    running (fewer than the limit) split the span of the candidate in a
+    few ranges, each checked with one range maximum.
+    """
+    if max_sim_recordings <= 0:
+        return []
+
+    programmed = sorted(programmed)
+    starts = [start for start, _ in programmed]
+    loads = _RangeMax(_programmed_loads(programmed))
+    programmed_running = []  # end times
+    admitted_running = []  # end times
+    admitted = []
+    next_programmed = 0
+
+    for start, end, payload in shift_same_starts(candidates):
+        while next_programmed < len(programmed) and programmed[next_programmed][0] <= start:
+            heapq.heappush(programmed_running, programmed[next_programmed][1])
+            next_programmed += 1
+        for running in (programmed_running, admitted_running):
+            while running and running[0] < start:
+                heapq.heappop(running)
+
+        if len(programmed_running) + len(admitted_running) >= max_sim_recordings:
+            continue
+
+        # Programmed recordings starting while the candidate runs, in ranges
+        # where the same number of admitted candidates is still running.
+        last = bisect_right(starts, end, lo=next_programmed)
+        first = next_programmed
+        still_running = len(admitted_running)
+        fits = True
+        for running_end in sorted(admitted_running) + [end]:
+            if first >= last:
+                break
+            bound = min(bisect_right(starts, running_end, lo=first), last)
+            if bound > first and loads.max(first, bound) + still_running >= max_sim_recordings:
+                fits = False
+                break
+            first = bound
+            still_running -= 1
+        if not fits:
+            continue
+
+        heapq.heappush(admitted_running, end)
+        admitted.append((start, end, payload))
+
+    return admitted
+
+
+def _benchmark(count):
+    import random
+    import time
+
+    from datetime import datetime
+
+    origin = datetime(2025, 1, 6, 6, 0)
+    week = 7 * 24 * 60
+
+    def random_interval():
+        start = origin + timedelta(minutes=random.randrange(week))
+        return start, start + timedelta(minutes=random.randrange(20, 180))
+
+    programmed = [random_interval() for _ in range(count // 50)]
+    candidates = [(*random_interval(), index) for index in range(count)]
+
+    begin = time.perf_counter()
+    admitted = plan_recordings(programmed, candidates, 2)
+    elapsed = time.perf_counter() - begin
+    print(
+        f"{len(programmed)} programmed, {count} candidates: "
+        f"{len(admitted)} admitted in {elapsed * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
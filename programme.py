@@ -0,0 +1,72 @@
+"""
+Programme of the media-select feed, parsed once when the feed is read.
+
+The start and end are kept as minutes since the epoch, the channel name is
+interned (a few dozen names for thousands of programmes) and the title is
+only sanitised when it is used. The dict read from the feed is kept as
+`record`, to compare two versions of a programme and to write it back.
+"""
+import sys
+
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from module_freeboxos import validate_video_title
+
+PARIS_TZ = ZoneInfo("Europe/Paris")
+
+# Outcome of a programme in a recording run
+PROGRAMMED = "programmed"
+SKIPPED = "skipped"  # not programmed, the next programmes are
+FAILED = "failed"  # Freebox internal error: the run stops
+
+
+def parse_start(start):
+    """'202501062050' (Paris time) -> minutes since the epoch."""
+    moment = datetime(
+        int(start[0:4]), int(start[4:6]), int(start[6:8]),
+        int(start[8:10]), int(start[10:12]), tzinfo=PARIS_TZ,
+    )
+    return int(moment.timestamp()) // 60
+
+
+def minute_to_datetime(minute):
+    """Minutes since the epoch -> aware datetime in Paris time."""
+    return datetime.fromtimestamp(minute * 60, PARIS_TZ)
+
+
+class Programme:
+    """A programme of the feed: channel name, start and end minutes, title."""
+
+    __slots__ = ("channel", "start_minute", "end_minute", "record", "_title")
+
+    def __init__(self, record):
+        self.record = record
+        self.channel = sys.intern(record["channel"])
+        self.start_minute = parse_start(record["start"])
+        # The feed durations are whole minutes, as the Freebox recordings.
+        self.end_minute = self.start_minute + record["duration"] // 60
+        self._title = None
+
+    def __repr__(self):
+        return f"Programme({self.record!r})"
+
+    @property
+    def key(self):
+        """Identity of the programme: channel, start and duration."""
+        return (self.channel, self.start_minute, self.end_minute)
+
+    @property
+    def start(self):
+        return minute_to_datetime(self.start_minute)
+
+    @property
+    def end(self):
+        return minute_to_datetime(self.end_minute)
+
+    @property
+    def title(self):
+        """Sanitised title, see module_freeboxos.validate_video_title()."""
+        if self._title is None:
+            self._title = validate_video_title(self.record["title"])
+        return self._title
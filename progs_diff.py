@@ -0,0 +1,55 @@
+"""
+Diff of two progweek feeds keyed by programme identity.
+
+A programme (programme.Programme) is identified by its channel, start and
+duration: a corrected title or any other field change makes it "modified",
+not a new programme.
+
+    diff = diff_programmes(info_progs, info_progs_last)
+    diff.added, diff.unchanged, diff.modified
+"""
+from typing import NamedTuple
+
+
+class ProgrammesDiff(NamedTuple):
+    added: list
+    unchanged: list
+    modified: list  # new version of the programmes whose fields changed
+
+
+def programme_key(programme):
+    """Stable identity of a programme of the media-select feed."""
+    return programme.key
+
+
+def diff_programmes(source, previous):
+    """
+    Compare the current feed `source` with the `previous` one in
+    O(len(source) + len(previous)). Programmes keep their order of
+    `source`; a duplicated identity in `source` is only reported once.
+    Both are iterables read once, `previous` first: `source` can be a
+    generator of progs_stream.iter_programmes().
+    """
+    previous_by_key = {}
+    for programme in previous:
+        previous_by_key.setdefault(programme_key(programme), programme)
+
+    added = []
+    unchanged = []
+    modified = []
+    seen = set()
+    for programme in source:
+        key = programme_key(programme)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        old = previous_by_key.get(key)
+        if old is None:
+            added.append(programme)
+        elif old.record == programme.record:
+            unchanged.append(programme)
+        else:
+            modified.append(programme)
+
+    return ProgrammesDiff(added, unchanged, modified)
@@ -0,0 +1,112 @@
+"""
+Incremental reading of the programme files (info_progs.json,
+info_progs_last.json, progs_to_record.json...), which all hold a JSON array
+of programmes.
+
+The array is decoded one programme at a time, so that the programmes
+outside of the recording window are dropped as they are read instead of
+being kept with the whole week:
+
+    for programme in iter_programmes(INFO_PROGS_FILE, not_before=now):
+        ...
+
+Each programme is parsed once into a programme.Programme.
+
+A malformed file, trailing data after the array included, raises
+json.JSONDecodeError, like json.load(), when the reader reaches the error.
+"""
+import json
+
+from programme import Programme
+
+CHUNK_SIZE = 64 * 1024  # characters
+WHITESPACE = " \t\n\r"
+NUMBER_CHARS = "0123456789+-.eE"
+
+_decoder = json.JSONDecoder()
+
+
+def iter_json_array(f, chunk_size=CHUNK_SIZE):
+    """Yield the items of the JSON array of the text file `f` one by one."""
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        # Drop what was decoded and append the next chunk. Return False at EOF.
+        nonlocal buffer, pos, eof
+        chunk = f.read(chunk_size)
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        eof = not chunk
+        return not eof
+
+    def next_char():
+        # Skip the whitespace and return the next character, "" at EOF.
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in WHITESPACE:
+                pos += 1
+            if pos < len(buffer) or not fill():
+                return buffer[pos:pos + 1]
+
+    def end_of_array():
+        # Only whitespace may follow the array, as with json.load().
+        nonlocal pos
+        pos += 1
+        if next_char():
+            raise json.JSONDecodeError("Extra data", buffer, pos)
+
+    if next_char() != "[":
+        raise json.JSONDecodeError("Expecting '['", buffer, pos)
+    pos += 1
+    if next_char() == "]":
+        end_of_array()
+        return
+
+    while True:
+        next_char()
+        while True:
+            try:
+                item, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            # A number may go on in the next chunk, even when the buffer ends
+            # on a "." or an "e" that raw_decode() left out: decode it again
+            # with more text.
+            if eof:
+                break
+            if end < len(buffer) and not (
+                isinstance(item, (int, float)) and buffer[end] in NUMBER_CHARS
+            ):
+                break
+            fill()
+        pos = end
+        yield item
+
+        separator = next_char()
+        if separator == "]":
+            end_of_array()
+            return
+        if separator != ",":
+            raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+        pos += 1
+
+
+def iter_programmes(path, not_before=None):
+    """
+    Yield the programmes of the JSON file `path` as Programme objects. With
+    `not_before` (an aware datetime), the programmes ended by then are
+    skipped.
+    """
+    if not_before is not None:
+        not_before = not_before.timestamp()
+    with open(path, "r", encoding='utf-8') as f:
+        for record in iter_json_array(f):
+            programme = Programme(record)
+            if not_before is not None and programme.end_minute * 60 <= not_before:
+                continue
+            yield programme
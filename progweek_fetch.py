@@ -0,0 +1,108 @@
+"""
+Download of the media-select progweek feed (info_progs.json).
+
+The request is conditional (If-None-Match / If-Modified-Since with the
+validators of the previous download) and compressed, and the file is
+replaced atomically, only when its content changed.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from pathlib import Path
+
+import requests
+
+logger = logging.getLogger("module_freeboxos")
+
+API_URL = "https://www.media-select.fr/api/v1/progweek"
+TIMEOUT = (5, 30)  # connect, read (seconds)
+
+UPDATED = "updated"
+NOT_MODIFIED = "not_modified"
+UNCHANGED = "unchanged"
+
+_session = None
+
+
+def get_session():
+    """Return the pooled HTTP session of the process."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        _session.headers.update({
+            "Accept": "application/json; indent=4",
+            "Accept-Encoding": "gzip, deflate",
+        })
+    return _session
+
+
+def _load_validators(path):
+    try:
+        with open(path, "r", encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def atomic_write(path, content):
+    """Write bytes to path through a temporary file and a rename."""
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp_", suffix=path.suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+
+def fetch_progweek(output_path, validators_path, auth=None, url=API_URL):
+    """
+    Refresh output_path from the progweek API.
+    Return UPDATED, NOT_MODIFIED (HTTP 304) or UNCHANGED (same body).
+    Raise requests.RequestException on HTTP errors and ValueError when the
+    body is not a JSON list; output_path is then left untouched.
+    """
+    output_path = Path(output_path)
+    validators = _load_validators(validators_path) if output_path.exists() else {}
+
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+
+    response = get_session().get(url, auth=auth, headers=headers, timeout=TIMEOUT)
+
+    if response.status_code == 304:
+        os.utime(output_path)
+        return NOT_MODIFIED
+    response.raise_for_status()
+
+    body = response.content
+    if not isinstance(json.loads(body), list):
+        raise ValueError("progweek answer is not a list of programmes")
+
+    digest = hashlib.sha256(body).hexdigest()
+    new_validators = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha256": digest,
+    }
+
+    if digest == validators.get("sha256"):
+        os.utime(output_path)
+        status = UNCHANGED
+    else:
+        atomic_write(output_path, body)
+        status = UPDATED
+
+    atomic_write(validators_path, json.dumps(new_validators).encode())
+    return status
@@ -0,0 +1,61 @@
+"""
+Index of the recordings already programmed on the Freebox.
+
+It is built once per run from the PVR "programmed" list of the Freebox OS
+API (directly with the API backend, through the logged-in page with the
+Selenium backend) and used to:
+  - skip the programmes which are already on the Freebox,
+  - give the capacity planner the real tuner usage.
+"""
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+# The same-start tweak of the planner can move a recording a few minutes
+# later: such a recording is still the same programme.
+from planner import MAX_START_SHIFT
+
+PARIS_TZ = ZoneInfo("Europe/Paris")
+
+
+class ProgrammedIndex:
+    """Recordings programmed on the Freebox keyed by (channel, start, end)."""
+
+    def __init__(self, recordings, uuid_to_number):
+        self.recordings = {}
+        self.intervals = []
+        for recording in recordings:
+            start = int(recording["start"])
+            end = int(recording["end"])
+            channel_number = uuid_to_number.get(recording.get("channel_uuid"))
+            self.recordings[(channel_number, start, end)] = recording
+            self.intervals.append((
+                datetime.fromtimestamp(start, PARIS_TZ),
+                datetime.fromtimestamp(end, PARIS_TZ),
+            ))
+
+    def __len__(self):
+        return len(self.recordings)
+
+    def find(self, channel_number, start, end):
+        """Return the Freebox recording of this programme, or None."""
+        start = int(start.timestamp())
+        end = int(end.timestamp())
+        for shift in range(MAX_START_SHIFT + 1):
+            seconds = int(timedelta(minutes=shift).total_seconds())
+            recording = self.recordings.get((channel_number, start + seconds, end + seconds))
+            if recording is not None:
+                return recording
+        return None
+
+    def contains(self, channel_number, start, end):
+        """True when this programme is already programmed on the Freebox."""
+        return self.find(channel_number, start, end) is not None
+
+
+def build_programmed_index(recordings, channel_uuids):
+    """
+    recordings: result of pvr/programmed/ (list of dicts with channel_uuid,
+    start and end as timestamps). channel_uuids: channel number -> uuid.
+    """
+    uuid_to_number = {uuid: number for number, uuid in channel_uuids.items()}
+    return ProgrammedIndex(recordings or [], uuid_to_number)
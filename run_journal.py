@@ -0,0 +1,108 @@
+"""
+Checkpoint journal of a recording run (run_journal.jsonl).
+
+The outcome of each programme is appended to the journal and fsynced as
+soon as it is known, i.e. once the Freebox confirmed the save. The journal
+is only cleared when a run completes and its feed is stored. After a crash,
+a kill or a Freebox internal error, the next run resumes the interrupted
+one: the programmes of the journal which were programmed are not
+programmed again, and still count for the tuner capacity.
+"""
+import json
+import logging
+import os
+import threading
+
+from config_freeboxos import BASE_DIR
+from programme import PROGRAMMED, minute_to_datetime
+
+logger = logging.getLogger("module_freeboxos")
+
+RUN_JOURNAL_FILE = BASE_DIR / "run_journal.jsonl"
+
+
+class RunJournal:
+    def __init__(self, path=None, not_before=None):
+        self.path = path or RUN_JOURNAL_FILE
+        self._lock = threading.Lock()
+        # programme key -> (start minute, end minute) used for the recording
+        self.programmed = {}
+        self._load(not_before)
+        self._file = open(self.path, "a", encoding='utf-8')
+
+    def _load(self, not_before):
+        after = int(not_before.timestamp()) // 60 if not_before is not None else -1
+        try:
+            with open(self.path, "r", encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line of a journal cut by a crash may be incomplete.
+                continue
+            if entry["outcome"] == PROGRAMMED and entry["end"] > after:
+                self.programmed[tuple(entry["key"])] = (entry["start"], entry["end"])
+        if self.programmed:
+            logger.info(
+                "Reprise de l'exécution interrompue: %d programme(s) déjà programmé(s).",
+                len(self.programmed),
+            )
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def is_programmed(self, video):
+        """True when `video` (a Programme) was programmed by the interrupted run."""
+        return video.key in self.programmed
+
+    def intervals(self):
+        """(start, end) aware datetimes of the recordings of the interrupted run."""
+        return [
+            (minute_to_datetime(start), minute_to_datetime(end))
+            for start, end in self.programmed.values()
+        ]
+
+    def write(self, programme, outcome):
+        """Append the outcome of a (video, start, end, channel_number) and fsync it."""
+        video, start, end, _ = programme
+        entry = {
+            "key": video.key,
+            "start": int(start.timestamp()) // 60,
+            "end": int(end.timestamp()) // 60,
+            "outcome": outcome,
+        }
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            if outcome == PROGRAMMED:
+                self.programmed[video.key] = (entry["start"], entry["end"])
+
+    def clear(self):
+        """Forget the journal: the run completed."""
+        with self._lock:
+            self._file.truncate(0)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.programmed = {}
+
+
+class JournaledOutcomes(list):
+    """(programme, outcome) pairs, written to a RunJournal as they are appended."""
+
+    def __init__(self, journal):
+        super().__init__()
+        self.journal = journal
+
+    def append(self, pair):
+        self.journal.write(*pair)
+        super().append(pair)
@@ -0,0 +1,140 @@
+"""
+Per-step timing of a freeboxos.py run.
+
+Each phase of a run is wrapped in a named span:
+
+    with tracer.span("login"):
+        login(driver, password)
+
+Nested spans are reported by their path, e.g. "programme/channel", and the
+wall time of every span is split into:
+  - remote: WebDriver commands and Freebox API requests,
+  - sleeping: polling intervals of the condition waits (waits.wait_until),
+  - own: everything else, i.e. our own code.
+
+The span stack and the remote/sleeping counters are kept per thread, so
+the spans of parallel browser workers do not count each other's time.
+
+The tracer is disabled by default; freeboxos.py --trace or --profile
+enables it and logs the summary table at the end of the run.
+"""
+import functools
+import logging
+import threading
+import time
+
+from contextlib import contextmanager
+
+logger = logging.getLogger("module_freeboxos")
+
+
+class RunTracer:
+    def __init__(self):
+        self.enabled = False
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        # path -> [count, wall, remote, sleeping], in order of first start
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+
+    def enable(self):
+        self.reset()
+        self.enabled = True
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _counters(self):
+        """[remote, sleeping] seconds of the current thread."""
+        counters = getattr(self._local, "counters", None)
+        if counters is None:
+            counters = self._local.counters = [0.0, 0.0]
+        return counters
+
+    @contextmanager
+    def span(self, name):
+        if not self.enabled:
+            yield
+            return
+        stack = self._stack()
+        counters = self._counters()
+        stack.append(name)
+        with self._stats_lock:
+            stats = self.stats.setdefault("/".join(stack), [0, 0.0, 0.0, 0.0])
+        begin = time.perf_counter()
+        remote, sleeping = counters
+        try:
+            yield
+        finally:
+            stack.pop()
+            wall = time.perf_counter() - begin
+            with self._stats_lock:
+                stats[0] += 1
+                stats[1] += wall
+                stats[2] += counters[0] - remote
+                stats[3] += counters[1] - sleeping
+
+    @contextmanager
+    def remote(self):
+        """Time spent waiting on Firefox or on the Freebox."""
+        if not self.enabled:
+            yield
+            return
+        counters = self._counters()
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            counters[0] += time.perf_counter() - begin
+
+    @contextmanager
+    def waiting(self):
+        """A condition wait: what is not a WebDriver command is sleeping."""
+        if not self.enabled:
+            yield
+            return
+        counters = self._counters()
+        begin = time.perf_counter()
+        remote = counters[0]
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - begin
+            counters[1] += max(0.0, elapsed - (counters[0] - remote))
+
+    def instrument_driver(self, driver):
+        """Count the WebDriver commands of `driver` as remote time."""
+        if getattr(driver, "_run_tracer", None) is self:
+            return driver
+        execute = driver.execute
+
+        @functools.wraps(execute)
+        def timed_execute(*args, **kwargs):
+            with self.remote():
+                return execute(*args, **kwargs)
+
+        driver.execute = timed_execute
+        driver._run_tracer = self
+        return driver
+
+    def summary(self):
+        """Table of the spans: calls and wall/remote/sleeping/own seconds."""
+        lines = [
+            f"{'step':<32} {'calls':>6} {'wall':>9} {'remote':>9} {'sleeping':>9} {'own':>9}"
+        ]
+        for path, (count, wall, remote, sleeping) in self.stats.items():
+            depth = path.count("/")
+            name = "  " * depth + path.rsplit("/", 1)[-1]
+            own = wall - remote - sleeping
+            lines.append(
+                f"{name:<32} {count:>6} {wall:>9.3f} {remote:>9.3f} {sleeping:>9.3f} {own:>9.3f}"
+            )
+        return "\n".join(lines)
+
+
+tracer = RunTracer()
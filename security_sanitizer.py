@@ -9,12 +9,13 @@ class SensitiveDataFilter(logging.Filter):
     Features:
       - Redacts sensitive keywords (generic scrub)
       - Redacts exact secret values after update_patterns() is called
-      - Scrubs:
-            * record.msg
-            * record.args
-            * record.exc_info (exception messages)
-            * record.exc_text (formatted traceback text)
-            * tracebacks printed by logger.exception()
+      - Scrubs, once per record:
+            * the formatted message (record.msg % record.args)
+            * record.exc_text (formatted traceback text, which holds the
+              exception messages)
+            * record.stack_info
+      - The scrubbed record is marked, so the filter can be attached to the
+        logger and to every handler for the price of one scrub
       - Prevents leakage of secrets in logs AND Sentry
 
     This filter MUST be installed BEFORE any secrets are loaded and BEFORE
@@ -25,27 +26,47 @@ class SensitiveDataFilter(logging.Filter):
         "password", "token", "secret", "credential", "auth", "authorization"
     ]
 
+    # Only redact if the word is followed by an assignment operator (= or :)
+    # This matches: "password: my_secret", "token=12345", "auth :  xyz"
+    # It will NOT match: "The credentials are missing"
+    GENERIC_PATTERNS = [
+        (word, re.compile(r"(?i)(" + re.escape(word) + r")\s*[:=]\s*[^\s,]+"))
+        for word in GENERIC_SENSITIVE_WORDS
+    ]
+
+    # Single pass over the lowercased text telling whether any of the
+    # patterns above can match.
+    GENERIC_DETECTOR = re.compile(
+        "(?:" + "|".join(sorted(GENERIC_SENSITIVE_WORDS, key=len, reverse=True)) + r")\s*[:=]"
+    )
+
+    # Attribute set on the records already scrubbed
+    SCRUBBED_ATTR = "_sensitive_data_scrubbed"
+
     def __init__(self, secrets=None):
         super().__init__()
-        self.secret_patterns = []
+        self.secrets = {}
+        self.secret_values = ()
+        self.secret_pattern = None
+        self._exception_formatter = logging.Formatter()
 
         if secrets:
             self.update_patterns(secrets)
 
     def update_patterns(self, secrets: dict):
         """
-        Add exact secret values to redact.
+        Add exact secret values to redact, by name: a new value replaces the
+        previous value of the same name.
         Call this AFTER secrets are loaded.
         """
-        self.secret_patterns = []
+        self.secrets.update(secrets)
+        values = {str(value) for value in self.secrets.values() if value}
 
-        for _, value in secrets.items():
-            if not value:
-                continue
-
-            # Escape exact secret value for safe regex
-            pattern = re.escape(str(value))
-            self.secret_patterns.append(re.compile(pattern))
+        # Escape exact secret values for safe regex; the longest first so that
+        # a secret containing another one is redacted as a whole.
+        self.secret_values = tuple(sorted(values, key=len, reverse=True))
+        escaped = [re.escape(value) for value in self.secret_values]
+        self.secret_pattern = re.compile("|".join(escaped)) if escaped else None
 
     def _scrub_string(self, text: str) -> str:
         """Apply generic and exact-pattern scrubbing to any string."""
@@ -53,154 +74,172 @@ class SensitiveDataFilter(logging.Filter):
         if not text:
             return text
 
-        lowered = text.lower()
-
         # 1. Generic keyword scrubbing (Catching 'key: value' patterns)
-        for word in self.GENERIC_SENSITIVE_WORDS:
-            if word in lowered:
-                # Only redact if the word is followed by an assignment operator (= or :)
-                # This matches: "password: my_secret", "token=12345", "auth :  xyz"
-                # It will NOT match: "The credentials are missing"
-                text = re.sub(
-                    r"(?i)(" + re.escape(word) + r")\s*[:=]\s*[^\s,]+",
-                    r"\1=[REDACTED]",
-                    text,
-                )
-
-        # 2. Precise secret scrubbing (after update_patterns())
-        for pattern in self.secret_patterns:
-            text = pattern.sub("[REDACTED]", text)
+        if ":" in text or "=" in text:
+            lowered = text.lower()
+            if self.GENERIC_DETECTOR.search(lowered):
+                for word, pattern in self.GENERIC_PATTERNS:
+                    if word in lowered:
+                        text = pattern.sub(r"\1=[REDACTED]", text)
+
+        # 2. Precise secret scrubbing (after update_patterns()); substring
+        # tests are much cheaper than a regex search which finds nothing.
+        for value in self.secret_values:
+            if value in text:
+                text = self.secret_pattern.sub("[REDACTED]", text)
+                break
 
         return text
 
     def filter(self, record):
         """Main entry point for Python's logging framework."""
 
-        # Scrub main message
-        if record.msg:
-            record.msg = self._scrub_string(str(record.msg))
-
-        # Scrub arguments
-        if record.args:
-            new_args = []
-            for arg in (record.args if isinstance(record.args, tuple) else [record.args]):
-                if isinstance(arg, str):
-                    new_args.append(self._scrub_string(arg))
-                else:
-                    new_args.append(arg)
-
-            record.args = tuple(new_args)
-
-        # Scrub exception info (type, value, traceback)
-        if record.exc_info:
-            etype, evalue, tb = record.exc_info
-
-            if evalue and hasattr(evalue, "args"):
-                new_args = []
-                for a in evalue.args:
-                    if isinstance(a, str):
-                        new_args.append(self._scrub_string(a))
-                    else:
-                        new_args.append(a)
-                evalue.args = tuple(new_args)
-
-        # Scrub formatted traceback text (generated by handler formatters)
-        if hasattr(record, "exc_text") and record.exc_text:
+        if getattr(record, self.SCRUBBED_ATTR, False):
+            return True
+
+        # Scrub the final message: the arguments are merged into it, so
+        # the handlers format the scrubbed text.
+        try:
+            message = record.getMessage()
+        except (TypeError, ValueError):
+            message = f"{record.msg} {record.args}"
+        record.msg = self._scrub_string(message)
+        record.args = None
+
+        # Format the traceback now (as the handler formatters would) and
+        # scrub it; the formatters reuse record.exc_text.
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+        if record.exc_text:
             record.exc_text = self._scrub_string(record.exc_text)
 
+        if record.stack_info:
+            record.stack_info = self._scrub_string(record.stack_info)
+
+        setattr(record, self.SCRUBBED_ATTR, True)
         return True
 
 global_sanitizer = SensitiveDataFilter()
 
-def scrub_event(event, hint):
+class SentryScrubber:
     """
-    Privacy-hardened Sentry scrubber.
+    Privacy-hardened Sentry scrubber, used as the before_send hook.
     Removes credentials, usernames in paths, hostnames, absolute paths,
     cwd, argv, and sensitive context values.
-    """
 
-    # Use the global instance so it "sees" the same secrets as the logger
-    scrub = global_sanitizer._scrub_string
-
-    # Resolve actual hostname once (fast)
-    try:
-        REAL_HOSTNAME = socket.gethostname()
-    except Exception:
-        REAL_HOSTNAME = None
+    Built once at Sentry init: the patterns are compiled and the hostname
+    resolved there. The walk of each event is iterative and bounded
+    (MAX_DEPTH nested containers, MAX_NODES values) and strings are
+    truncated to MAX_STRING_LENGTH before being scrubbed, so that a burst
+    of large events cannot make the hook expensive.
+    """
 
-    # Regex to scrub usernames in paths
     USER_HOME_RE = re.compile(r"/home/[^/]+")
-    def redact_user_home(value: str) -> str:
-        return USER_HOME_RE.sub("/home/REDACTED_USER", value)
-
-    # Safely redact hostname (only when exact match or substring match)
-    def redact_hostname(value: str) -> str:
-        if REAL_HOSTNAME and REAL_HOSTNAME in value:
-            return value.replace(REAL_HOSTNAME, "[REDACTED_HOST]")
-        return value
-
-    def sanitize_value(value):
-        if isinstance(value, str):
-            value = scrub(value)
-            value = redact_user_home(value)
-            value = redact_hostname(value)
+    FRAME_KEYS = ("filename", "abs_path", "context_line", "function")
+
+    MAX_DEPTH = 10
+    MAX_NODES = 5000
+    MAX_STRING_LENGTH = 4096
+    TRUNCATED = "[TRUNCATED]"
+
+    def __init__(self, sanitizer=None, hostname=None):
+        # Use the global instance so it "sees" the same secrets as the logger
+        self.sanitizer = sanitizer or global_sanitizer
+        if hostname is None:
+            try:
+                hostname = socket.gethostname()
+            except Exception:
+                hostname = None
+        self.hostname = hostname
+
+    def sanitize_value(self, value):
+        if not isinstance(value, str):
+            return value
+        truncated = len(value) > self.MAX_STRING_LENGTH
+        if truncated:
+            # Keep enough text after the cut for a secret starting before it
+            # to be redacted as a whole.
+            margin = max(map(len, self.sanitizer.secret_values), default=0)
+            value = value[:self.MAX_STRING_LENGTH + margin]
+        value = self.sanitizer._scrub_string(value)
+        value = self.USER_HOME_RE.sub("/home/REDACTED_USER", value)
+        # Safely redact hostname (only when exact match or substring match)
+        if self.hostname and self.hostname in value:
+            value = value.replace(self.hostname, "[REDACTED_HOST]")
+        if truncated:
+            value = value[:self.MAX_STRING_LENGTH] + self.TRUNCATED
         return value
 
-    def sanitize_dict(d):
-        for key, val in list(d.items()):
-            if isinstance(val, str):
-                d[key] = sanitize_value(val)
-            elif isinstance(val, dict):
-                sanitize_dict(val)
-            elif isinstance(val, list):
-                d[key] = [sanitize_value(item) for item in val]
-        return d
-
-    # -------- Scrub event structure --------
-
-    if "server_name" in event:
-        event["server_name"] = "[REDACTED_HOST]"
-
-    if "request" in event:
-        sanitize_dict(event["request"])
-
-    if "extra" in event:
-        sanitize_dict(event["extra"])
-
-    if "exception" in event:
-        for exc in event["exception"].get("values", []):
-            if "value" in exc:
-                exc["value"] = sanitize_value(exc["value"])
-
-            if "stacktrace" in exc:
-                frames = exc["stacktrace"].get("frames", [])
-                for frame in frames:
-                    for k in ("filename", "abs_path", "context_line", "function"):
-                        if k in frame:
-                            frame[k] = sanitize_value(frame[k])
-
-                    if "vars" in frame:
-                        sanitize_dict(frame["vars"])
-
-    if "contexts" in event:
-        sanitize_dict(event["contexts"])
-
-    if "breadcrumbs" in event:
-        filtered = []
-        for crumb in event["breadcrumbs"].get("values", []):
-            if crumb.get("type") == "subprocess":
-                continue
-            sanitize_dict(crumb)
-            filtered.append(crumb)
-
-        event["breadcrumbs"]["values"] = filtered
-
-    # Redact sys.argv and cwd explicitly
-    if "extra" in event:
-        if "sys.argv" in event["extra"]:
-            event["extra"]["sys.argv"] = ["[REDACTED_ARG]"]
-
-        if "cwd" in event["extra"]:
-            event["extra"]["cwd"] = "[REDACTED_CWD]"
-
-    return event
+    def sanitize_tree(self, root):
+        """Scrub in place the strings of nested dicts and lists."""
+        if not isinstance(root, (dict, list)):
+            return root
+        budget = self.MAX_NODES
+        stack = [(root, 0)]
+        while stack:
+            container, depth = stack.pop()
+            keys = container.keys() if isinstance(container, dict) else range(len(container))
+            for key in list(keys):
+                budget -= 1
+                if budget < 0:
+                    container[key] = self.TRUNCATED
+                    continue
+                value = container[key]
+                if isinstance(value, str):
+                    container[key] = self.sanitize_value(value)
+                elif isinstance(value, (dict, list)):
+                    if depth + 1 >= self.MAX_DEPTH:
+                        container[key] = self.TRUNCATED
+                    else:
+                        stack.append((value, depth + 1))
+                elif isinstance(value, tuple):
+                    container[key] = [self.sanitize_value(item) for item in value]
+        return root
+
+    def __call__(self, event, hint):
+        # -------- Scrub event structure --------
+
+        if "server_name" in event:
+            event["server_name"] = "[REDACTED_HOST]"
+
+        for key in ("request", "extra", "contexts", "logentry"):
+            if key in event:
+                self.sanitize_tree(event[key])
+
+        if "message" in event:
+            event["message"] = self.sanitize_value(event["message"])
+
+        if "exception" in event:
+            for exc in event["exception"].get("values", []):
+                if "value" in exc:
+                    exc["value"] = self.sanitize_value(exc["value"])
+
+                if "stacktrace" in exc:
+                    frames = exc["stacktrace"].get("frames", [])
+                    for frame in frames:
+                        for k in self.FRAME_KEYS:
+                            if k in frame:
+                                frame[k] = self.sanitize_value(frame[k])
+
+                        if "vars" in frame:
+                            self.sanitize_tree(frame["vars"])
+
+        if "breadcrumbs" in event:
+            filtered = []
+            for crumb in event["breadcrumbs"].get("values", []):
+                if crumb.get("type") == "subprocess":
+                    continue
+                self.sanitize_tree(crumb)
+                filtered.append(crumb)
+
+            event["breadcrumbs"]["values"] = filtered
+
+        # Redact sys.argv and cwd explicitly
+        if "extra" in event:
+            if "sys.argv" in event["extra"]:
+                event["extra"]["sys.argv"] = ["[REDACTED_ARG]"]
+
+            if "cwd" in event["extra"]:
+                event["extra"]["cwd"] = "[REDACTED_CWD]"
+
+        return event
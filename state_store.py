@@ -0,0 +1,256 @@
+"""
+State kept from one run to the next, in an SQLite database (state.db):
+
+  - programmes: the feed of the last successful run, which the next feed is
+    compared with (it replaces info_progs_last.json),
+  - runs and outcomes: the history of the runs and of what happened to
+    each programme (programmed, skipped, failed).
+
+The database is in WAL mode, so that cron_select.py and the daemon can
+read it while a run writes. Programmes are indexed by start time and
+channel. A programme row is only written when it is new or changed.
+
+    with StateStore() as store:
+        previous = store.programmes(not_before=now)
+
+"python3 state_store.py" prints the last runs.
+"""
+import json
+import logging
+import sqlite3
+import sys
+import time
+
+from config_freeboxos import BASE_DIR, INFO_PROGS_LAST_FILE
+from programme import FAILED, PROGRAMMED, SKIPPED, Programme, minute_to_datetime
+from progs_stream import iter_programmes
+
+logger = logging.getLogger("module_freeboxos")
+
+STATE_DB_FILE = BASE_DIR / "state.db"
+SCHEMA_VERSION = 1
+
+# Run status
+RUNNING = "running"
+DONE = "done"
+ABORTED = "aborted"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS programmes (
+    channel TEXT NOT NULL,
+    start_minute INTEGER NOT NULL,
+    end_minute INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (channel, start_minute, end_minute)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS programmes_start ON programmes (start_minute, channel);
+
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    backend TEXT,
+    status TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS outcomes (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    channel TEXT NOT NULL,
+    channel_number TEXT,
+    start_minute INTEGER NOT NULL,
+    end_minute INTEGER NOT NULL,
+    title TEXT,
+    outcome TEXT NOT NULL,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outcomes_start ON outcomes (start_minute, channel);
+CREATE INDEX IF NOT EXISTS outcomes_run ON outcomes (run_id);
+"""
+
+
+class StateStore:
+    def __init__(self, path=None):
+        path = path or STATE_DB_FILE
+        self.connection = sqlite3.connect(str(path), timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            with self.connection:
+                self.connection.executescript(SCHEMA)
+                self._import_info_progs_last()
+                self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _import_info_progs_last(self):
+        """Start from info_progs_last.json, the state of the older versions."""
+        try:
+            programmes = list(iter_programmes(INFO_PROGS_LAST_FILE))
+        except FileNotFoundError:
+            return
+        except json.JSONDecodeError as e:
+            logger.warning("info_progs_last.json illisible, non importé: %s", e)
+            return
+        self._upsert(programmes)
+        logger.info("%d programmes importés de info_progs_last.json.", len(programmes))
+
+    def _upsert(self, programmes):
+        self.connection.executemany(
+            "INSERT INTO programmes (channel, start_minute, end_minute, record) "
+            "VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (channel, start_minute, end_minute) DO UPDATE "
+            "SET record = excluded.record WHERE programmes.record != excluded.record",
+            (
+                (p.channel, p.start_minute, p.end_minute, json.dumps(p.record, ensure_ascii=False))
+                for p in programmes
+            ),
+        )
+
+    def programmes(self, not_before=None):
+        """
+        Yield the programmes of the last successful run as Programme objects,
+        by start. With `not_before` (an aware datetime), the programmes ended
+        by then are left out.
+        """
+        after = int(not_before.timestamp()) // 60 if not_before is not None else -1
+        rows = self.connection.execute(
+            "SELECT record FROM programmes WHERE end_minute > ? ORDER BY start_minute",
+            (after,),
+        )
+        for (record,) in rows:
+            yield Programme(json.loads(record))
+
+    def intervals(self, not_before):
+        """(start, end) aware datetimes of the programmes not over at `not_before`."""
+        after = int(not_before.timestamp()) // 60
+        return [
+            (minute_to_datetime(start), minute_to_datetime(end))
+            for start, end in self.connection.execute(
+                "SELECT start_minute, end_minute FROM programmes WHERE end_minute > ?",
+                (after,),
+            )
+        ]
+
+    def commit_feed(self, programmes, not_before):
+        """
+        Make `programmes` (the feed of a successful run, not over at
+        `not_before`) the reference of the next diff. Only the new and
+        changed rows are written; the others are deleted.
+        """
+        programmes = list(programmes)
+        after = int(not_before.timestamp()) // 60
+        with self.connection:
+            self._upsert(programmes)
+            # Keyed like programmes, so that the NOT EXISTS below is one
+            # lookup per row instead of a scan of the feed.
+            self.connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS feed_keys "
+                "(channel TEXT, start_minute INTEGER, end_minute INTEGER, "
+                "PRIMARY KEY (channel, start_minute, end_minute)) WITHOUT ROWID"
+            )
+            self.connection.execute("DELETE FROM feed_keys")
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO feed_keys VALUES (?, ?, ?)", (p.key for p in programmes)
+            )
+            self.connection.execute(
+                "DELETE FROM programmes WHERE end_minute <= ? OR NOT EXISTS ("
+                "SELECT 1 FROM feed_keys f WHERE f.channel = programmes.channel "
+                "AND f.start_minute = programmes.start_minute "
+                "AND f.end_minute = programmes.end_minute)",
+                (after,),
+            )
+
+    def start_run(self, backend):
+        """Record the start of a recording run. Return its id."""
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (started_at, backend, status) VALUES (?, ?, ?)",
+                (time.time(), backend, RUNNING),
+            )
+        return cursor.lastrowid
+
+    def finish_run(self, run_id, status):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE runs SET finished_at = ?, status = ? WHERE id = ?",
+                (time.time(), status, run_id),
+            )
+
+    def record_outcomes(self, run_id, outcomes):
+        """
+        Store the ((video, start, end, channel_number), outcome) pairs of a
+        run, with the start and end actually used for the recording.
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO outcomes (run_id, channel, channel_number, start_minute, "
+                "end_minute, title, outcome, at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        run_id, video.channel, channel_number,
+                        int(start.timestamp()) // 60, int(end.timestamp()) // 60,
+                        video.title, outcome, now,
+                    )
+                    for (video, start, end, channel_number), outcome in outcomes
+                ),
+            )
+
+    def last_successful_run(self):
+        """End time (timestamp) of the last run which updated the feed, or None."""
+        row = self.connection.execute(
+            "SELECT MAX(finished_at) FROM runs WHERE status = ?", (DONE,)
+        ).fetchone()
+        return row[0]
+
+    def run_history(self, limit=10):
+        """
+        The last runs, most recent first: (id, started_at, finished_at,
+        backend, status, programmed, skipped, failed).
+        """
+        return self.connection.execute(
+            "SELECT r.id, r.started_at, r.finished_at, r.backend, r.status, "
+            "COUNT(CASE o.outcome WHEN ? THEN 1 END), "
+            "COUNT(CASE o.outcome WHEN ? THEN 1 END), "
+            "COUNT(CASE o.outcome WHEN ? THEN 1 END) "
+            "FROM runs r LEFT JOIN outcomes o ON o.run_id = r.id "
+            "GROUP BY r.id ORDER BY r.id DESC LIMIT ?",
+            (PROGRAMMED, SKIPPED, FAILED, limit),
+        ).fetchall()
+
+
+def _format_time(timestamp):
+    if timestamp is None:
+        return "-"
+    return time.strftime("%d/%m/%Y %H:%M:%S", time.localtime(timestamp))
+
+
+def main():
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    if not STATE_DB_FILE.exists():
+        print("Aucune exécution enregistrée.")
+        return
+    with StateStore() as store:
+        print(
+            f"{'run':>5} {'début':<19} {'fin':<19} {'mode':<8} {'statut':<8} "
+            f"{'programmés':>10} {'ignorés':>8} {'échecs':>7}"
+        )
+        for run_id, started, finished, backend, status, programmed, skipped, failed in (
+            store.run_history(limit)
+        ):
+            print(
+                f"{run_id:>5} {_format_time(started):<19} {_format_time(finished):<19} "
+                f"{backend or '-':<8} {status:<8} {programmed:>10} {skipped:>8} {failed:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
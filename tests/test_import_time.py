@@ -0,0 +1,40 @@
+"""
+The cron entry points must start without the heavy dependencies: they are
+imported where they are used, once there is something to record.
+"""
+import subprocess
+import sys
+import unittest
+
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("selenium", "requests", "sentry_sdk", "keyring", "bs4")
+
+CHECK = (
+    "import sys\n"
+    "import freeboxos, cron_select\n"
+    "print(' '.join(name for name in {heavy!r} if name in sys.modules))\n"
+).format(heavy=HEAVY_MODULES)
+
+
+class ImportTimeTest(unittest.TestCase):
+    def test_entry_points_do_not_import_heavy_modules(self):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", CHECK],
+            cwd=REPO_DIR, capture_output=True, text=True, timeout=60,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split(), [])
+
+        # "import time: self [us] | cumulative | imported package" lines
+        imported = {
+            line.rsplit("|", 1)[1].strip().split(".")[0]
+            for line in result.stderr.splitlines()
+            if line.startswith("import time:") and "|" in line
+        }
+        self.assertFalse(imported & set(HEAVY_MODULES), sorted(imported & set(HEAVY_MODULES)))
+
+
+if __name__ == "__main__":
+    unittest.main()
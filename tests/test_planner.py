@@ -0,0 +1,110 @@
+import unittest
+
+from datetime import datetime, timedelta
+
+from planner import MAX_START_SHIFT, plan_recordings, shift_same_starts
+from reconcile import build_programmed_index
+
+ORIGIN = datetime(2025, 1, 6, 20, 0)
+
+
+def at(minutes):
+    return ORIGIN + timedelta(minutes=minutes)
+
+
+def interval(start, end):
+    return at(start), at(end)
+
+
+def candidate(start, end, payload):
+    return at(start), at(end), payload
+
+
+def payloads(admitted):
+    return [payload for _, _, payload in admitted]
+
+
+class CapacityTest(unittest.TestCase):
+    def test_overlapping_candidates_up_to_the_limit(self):
+        candidates = [candidate(0, 60, "a"), candidate(10, 70, "b"), candidate(20, 80, "c")]
+        self.assertEqual(payloads(plan_recordings([], candidates, 2)), ["a", "b"])
+        self.assertEqual(payloads(plan_recordings([], candidates, 3)), ["a", "b", "c"])
+
+    def test_no_tuner(self):
+        self.assertEqual(plan_recordings([], [candidate(0, 60, "a")], 0), [])
+
+    def test_programmed_recordings_keep_their_tuner(self):
+        programmed = [interval(0, 60)]
+        candidates = [candidate(10, 30, "a"), candidate(20, 40, "b")]
+        self.assertEqual(payloads(plan_recordings(programmed, candidates, 2)), ["a"])
+
+    def test_programmed_recording_starting_during_the_candidate(self):
+        # Two tuners: "a" would be the third recording at 0:30.
+        programmed = [interval(30, 90), interval(30, 100)]
+        self.assertEqual(plan_recordings(programmed, [candidate(0, 60, "a")], 2), [])
+        self.assertEqual(payloads(plan_recordings(programmed, [candidate(0, 30, "a")], 2)), [])
+        self.assertEqual(payloads(plan_recordings(programmed, [candidate(0, 29, "a")], 2)), ["a"])
+
+    def test_admitted_candidate_ended_before_a_programmed_start(self):
+        programmed = [interval(50, 120)]
+        candidates = [candidate(0, 40, "a"), candidate(10, 100, "b")]
+        self.assertEqual(payloads(plan_recordings(programmed, candidates, 2)), ["a", "b"])
+
+    def test_admitted_candidate_running_at_a_programmed_start(self):
+        programmed = [interval(50, 120)]
+        candidates = [candidate(0, 60, "a"), candidate(10, 100, "b")]
+        self.assertEqual(payloads(plan_recordings(programmed, candidates, 2)), ["a"])
+
+
+class BackToBackTest(unittest.TestCase):
+    def test_next_programme_starting_at_the_end_minute_overlaps(self):
+        # The Freebox needs the tuner until the end minute.
+        candidates = [candidate(0, 60, "a"), candidate(60, 120, "b")]
+        self.assertEqual(payloads(plan_recordings([], candidates, 1)), ["a"])
+
+    def test_next_programme_starting_after_the_end_minute(self):
+        candidates = [candidate(0, 59, "a"), candidate(60, 120, "b"), candidate(121, 180, "c")]
+        self.assertEqual(payloads(plan_recordings([], candidates, 1)), ["a", "b", "c"])
+
+    def test_back_to_back_with_a_programmed_recording(self):
+        programmed = [interval(0, 59)]
+        self.assertEqual(payloads(plan_recordings(programmed, [candidate(60, 90, "a")], 1)), ["a"])
+        self.assertEqual(plan_recordings(programmed, [candidate(59, 90, "a")], 1), [])
+
+
+class SameStartTest(unittest.TestCase):
+    def test_same_starts_are_moved_one_minute_apart(self):
+        shifted = list(shift_same_starts([
+            candidate(0, 60, "a"), candidate(0, 30, "b"), candidate(1, 40, "c"),
+        ]))
+        self.assertEqual(shifted, [
+            candidate(0, 60, "a"), candidate(1, 31, "b"), candidate(2, 41, "c"),
+        ])
+
+    def test_shift_is_capped(self):
+        candidates = [candidate(0, 60, name) for name in "abcdef"]
+        shifted = list(shift_same_starts(candidates))
+        self.assertEqual(payloads(shifted), list("abcd"))
+        self.assertEqual(shifted[-1][0], at(MAX_START_SHIFT))
+
+    def test_shifted_recordings_are_found_on_the_freebox(self):
+        # Different durations, so that each programme has its own identity.
+        candidates = [candidate(0, 60 + index, name) for index, name in enumerate("abcdef")]
+        admitted = plan_recordings([], candidates, 10)
+        self.assertEqual(payloads(admitted), list("abcd"))
+        recordings = [
+            {"channel_uuid": "uuid-1", "start": int(start.timestamp()), "end": int(end.timestamp())}
+            for start, end, _ in admitted
+        ]
+        index = build_programmed_index(recordings, {"1": "uuid-1"})
+        for start, end, name in candidates:
+            self.assertEqual(index.contains("1", start, end), name in "abcd", name)
+
+    def test_shifted_candidates_count_for_the_capacity(self):
+        candidates = [candidate(0, 60, name) for name in "abc"]
+        admitted = plan_recordings([], candidates, 2)
+        self.assertEqual(admitted, [candidate(0, 60, "a"), candidate(1, 61, "b")])
+
+
+if __name__ == "__main__":
+    unittest.main()
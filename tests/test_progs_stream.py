@@ -0,0 +1,81 @@
+import io
+import json
+import tempfile
+import unittest
+
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+from progs_stream import iter_json_array, iter_programmes
+
+CHUNK_SIZES = (1, 2, 7, 64 * 1024)
+
+PROGRAMMES = [
+    {"channel": "FRANCE 2", "title": "Journal", "start": "202501062000", "duration": 2700},
+    {"channel": "ARTE", "title": "Cinéma \"classique\" \\ é", "start": "202501062050", "duration": 6300},
+    {"channel": "TF1", "title": "Série", "start": "202501070900", "duration": 3600},
+]
+
+
+def decode(text, chunk_size):
+    return list(iter_json_array(io.StringIO(text), chunk_size))
+
+
+class IterJsonArrayTest(unittest.TestCase):
+    def assertDecodesLikeJson(self, text):
+        for chunk_size in CHUNK_SIZES:
+            with self.subTest(text=text, chunk_size=chunk_size):
+                self.assertEqual(decode(text, chunk_size), json.loads(text))
+
+    def test_programmes(self):
+        self.assertDecodesLikeJson(json.dumps(PROGRAMMES, indent=4, ensure_ascii=False))
+        self.assertDecodesLikeJson(json.dumps(PROGRAMMES, separators=(",", ":")))
+
+    def test_empty_array(self):
+        for text in ("[]", "  [ \n ]  \n", "[\n]"):
+            self.assertDecodesLikeJson(text)
+
+    def test_numbers_split_across_chunks(self):
+        for text in (
+            "[1.5,2e10,-3.25E-7,12345678901234567890]",
+            "[ 1.0 , 0 , -0.5 , 1e+5 ]",
+            "[1.5]",
+            "[100,2.5e-3]",
+        ):
+            self.assertDecodesLikeJson(text)
+
+    def test_strings_split_across_chunks(self):
+        self.assertDecodesLikeJson(json.dumps(["éè\\\"x", "", "\\u00e9", "a" * 100]))
+        self.assertDecodesLikeJson('["\\u00e9\\n", "\\"]"]')
+
+    def test_literals_and_nested_values(self):
+        self.assertDecodesLikeJson('[true, false, null, [1, [2.5]], {"a": {"b": [null]}}]')
+
+    def test_malformed_input(self):
+        for text in (
+            "", "   ", "{}", "[1,", "[1 2]", "[1,]", "[1.]", "[1e]", "[-]",
+            '["abc', "[tru]", "[1,2]garbage", "[] x", "[1] ]",
+        ):
+            for chunk_size in CHUNK_SIZES:
+                with self.subTest(text=text, chunk_size=chunk_size):
+                    with self.assertRaises(ValueError):
+                        decode(text, chunk_size)
+
+    def test_trailing_whitespace(self):
+        self.assertDecodesLikeJson("[1, 2]  \n\t ")
+
+
+class IterProgrammesTest(unittest.TestCase):
+    def test_programmes_ended_before_not_before_are_skipped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "info_progs.json"
+            path.write_text(json.dumps(PROGRAMMES), encoding="utf-8")
+            not_before = datetime(2025, 1, 6, 20, 45, tzinfo=ZoneInfo("Europe/Paris"))
+            titles = [programme.title for programme in iter_programmes(path, not_before)]
+        # The 20:00 programme ends at 20:45: it is over.
+        self.assertEqual(titles, ['Cinéma classique \\ é', "Série"])
+
+
+if __name__ == "__main__":
+    unittest.main()
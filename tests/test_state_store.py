@@ -0,0 +1,70 @@
+import tempfile
+import time
+import unittest
+
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+from zoneinfo import ZoneInfo
+
+import state_store
+
+from programme import Programme
+from state_store import StateStore
+
+NOW = datetime(2025, 1, 6, 12, 0, tzinfo=ZoneInfo("Europe/Paris"))
+
+
+def make_feed(count, channels=50):
+    return [
+        Programme({
+            "channel": f"CHANNEL {index % channels}",
+            "title": f"Programme {index}",
+            "start": (NOW + timedelta(hours=1, minutes=5 * (index // channels)))
+            .strftime("%Y%m%d%H%M"),
+            "duration": 3600,
+        })
+        for index in range(count)
+    ]
+
+
+class CommitFeedTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        patcher = mock.patch.object(
+            state_store, "INFO_PROGS_LAST_FILE", Path(self.directory.name) / "missing.json"
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = StateStore(Path(self.directory.name) / "state.db")
+        self.addCleanup(self.store.close)
+
+    def keys(self):
+        return [programme.key for programme in self.store.programmes()]
+
+    def test_second_commit_of_the_same_feed_is_fast_and_keeps_the_rows(self):
+        feed = make_feed(10000)
+        self.store.commit_feed(feed, NOW)
+        begin = time.perf_counter()
+        self.store.commit_feed(feed, NOW)
+        elapsed = time.perf_counter() - begin
+
+        self.assertEqual(sorted(self.keys()), sorted(programme.key for programme in feed))
+        # Quadratic before feed_keys had a key: several seconds for 10k rows.
+        self.assertLess(elapsed, 2.0)
+
+    def test_programmes_left_out_of_the_feed_are_deleted(self):
+        feed = make_feed(100)
+        self.store.commit_feed(feed, NOW)
+        self.store.commit_feed(feed[10:], NOW)
+        self.assertEqual(sorted(self.keys()), sorted(programme.key for programme in feed[10:]))
+
+    def test_duplicated_programmes_are_stored_once(self):
+        feed = make_feed(10)
+        self.store.commit_feed(feed + feed[:3], NOW)
+        self.assertEqual(len(self.keys()), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Condition-based waits for the Freebox OS web interface.
+
+Each step of the Selenium flow waits for a readiness condition with its own
+timeout instead of sleeping for a fixed duration. Timeouts can be tuned with
+the WAIT_TIMEOUTS dictionary of config.json, e.g.:
+
+    "WAIT_TIMEOUTS": {"login": 60, "save": 45}
+"""
+from selenium.common.exceptions import (
+    ElementNotInteractableException,
+    NoSuchElementException,
+    StaleElementReferenceException,
+)
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from run_trace import tracer
+
+DEFAULT_TIMEOUTS = {
+    "page_load": 30,
+    "login": 30,
+    "open_form": 15,
+    "channel": 5,
+    "date": 10,
+    "time_field": 10,
+    "title": 10,
+    "save": 30,
+    "cancel": 15,
+    "settle": 15,
+}
+POLL_INTERVAL = 0.2
+
+IGNORED_EXCEPTIONS = (
+    NoSuchElementException,
+    StaleElementReferenceException,
+    ElementNotInteractableException,
+)
+
+XHR_SETTLED_SCRIPT = """
+if (window.Ext && Ext.Ajax && Ext.Ajax.isLoading) {
+    return document.readyState === 'complete' && !Ext.Ajax.isLoading();
+}
+return document.readyState === 'complete';
+"""
+
+timeouts = dict(DEFAULT_TIMEOUTS)
+
+
+def configure_waits(overrides):
+    """Override the default per-step timeouts (in seconds)."""
+    for step, value in (overrides or {}).items():
+        if step in DEFAULT_TIMEOUTS:
+            timeouts[step] = float(value)
+
+
+def wait_until(driver, condition, step):
+    """
+    Wait until `condition(driver)` returns a truthy value and return it.
+    Raise selenium TimeoutException after the timeout of `step`.
+    """
+    wait = WebDriverWait(
+        driver,
+        timeouts[step],
+        poll_frequency=POLL_INTERVAL,
+        ignored_exceptions=IGNORED_EXCEPTIONS,
+    )
+    with tracer.waiting():
+        return wait.until(condition, message=f"step '{step}' not ready")
+
+
+def element_present(locator):
+    return EC.presence_of_element_located(locator)
+
+
+def element_clickable(locator):
+    return EC.element_to_be_clickable(locator)
+
+
+def element_visible(locator):
+    return EC.visibility_of_element_located(locator)
+
+
+def element_gone(locator):
+    """The element is absent or hidden, e.g. a modal window was closed."""
+    return EC.invisibility_of_element_located(locator)
+
+
+def any_of(*conditions):
+    return EC.any_of(*conditions)
+
+
+def field_value_matches(element, test):
+    """The value of an input field satisfies `test(value)`."""
+    def _predicate(driver):
+        return test(element.get_attribute("value") or "")
+    return _predicate
+
+
+def xhr_settled():
+    """The page is loaded and no Ajax request of Freebox OS is running."""
+    def _predicate(driver):
+        return driver.execute_script(XHR_SETTLED_SCRIPT)
+    return _predicate